@@ -0,0 +1,155 @@
+"""Throughput and latency of the API served sync (WSGI workers) versus async (ASGI).
+
+Both modes replay the same seeded request mix from loadtest.py against a
+fresh throwaway database, with --concurrency clients in flight. The sync
+mode models one process of --sync-workers WSGI workers, so requests beyond
+that queue for a worker. The async mode serves every request through
+book_rental_store_api.asgi's AsyncApp on one event loop. Requests go
+straight into the application in-process, without a network server.
+
+    python benchmarks/bench_async.py [--concurrency 32] [--sync-workers 1] [--uncached-logins]
+
+--uncached-logins turns the credential cache off so every request pays
+for an argon2 verify, the case the async mode's hash executor is for.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from loadtest import DEFAULT_MIX, FlaskTarget, InProcessTransport, git_revision, make_plan, parse_mix, run, summarise
+
+
+class SyncTransport(InProcessTransport):
+    """The WSGI app behind a fixed number of single-request workers, queued first come first served."""
+
+    def __init__(self, app, workers):
+        super().__init__(app)
+        self.workers = ThreadPoolExecutor(workers)
+
+    def send(self, method, path, headers, body):
+        return self.workers.submit(super().send, method, path, headers, body).result()
+
+    def close(self):
+        self.workers.shutdown()
+
+
+class AsyncTransport():
+    """An AsyncApp driven by an event loop on its own thread."""
+
+    def __init__(self, app):
+        from book_rental_store_api.aio import AsyncApp
+
+        self.application = AsyncApp(app)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    async def request(self, method, path, headers, body):
+        body = (body or '').encode('utf-8')
+        path, _, query = path.partition('?')
+        headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+        headers.append((b'content-length', str(len(body)).encode()))
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'headers': headers, 'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+        }
+        status = None
+        messages = iter([{'type': 'http.request', 'body': body, 'more_body': False}])
+
+        async def receive():
+            return next(messages, {'type': 'http.disconnect'})
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        await self.application(scope, receive, send)
+        return status
+
+    def send(self, method, path, headers, body):
+        return asyncio.run_coroutine_threadsafe(self.request(method, path, headers, body), self.loop).result()
+
+    def close(self):
+        self.application.executors.shutdown()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+def bench(mode, args):
+    db_fd, db_path = tempfile.mkstemp(suffix='.sqlite3')
+    target = FlaskTarget(db_path, args.books, args.users, args.auth)
+    if args.uncached_logins:
+        target.app.extensions['credential_cache'].maxsize = 0
+    if args.request_workers:
+        target.app.config['API_ASYNC_REQUEST_WORKERS'] = args.request_workers
+    transport = AsyncTransport(target.app) if mode == 'async' else SyncTransport(target.app, args.sync_workers)
+    try:
+        run(target, transport, make_plan(args.mix, args.warmup, args.books, args.users, args.seed - 1),
+            args.concurrency)
+        samples, elapsed = run(target, transport,
+                               make_plan(args.mix, args.requests, args.books, args.users, args.seed),
+                               args.concurrency)
+    finally:
+        transport.close()
+        target.close()
+        os.close(db_fd)
+        os.unlink(db_path)
+    return summarise(samples, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help=f'endpoint=weight pairs (default {DEFAULT_MIX})')
+    parser.add_argument('--concurrency', type=int, default=32, help='requests in flight')
+    parser.add_argument('--sync-workers', type=int, default=1, help='WSGI workers in the sync process')
+    parser.add_argument('--request-workers', type=int,
+                        help='request threads in the async process (API_ASYNC_REQUEST_WORKERS)')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=100, help='requests sent before measuring')
+    parser.add_argument('--books', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--auth', choices=['token', 'basic'], default='basic', help='API authentication')
+    parser.add_argument('--uncached-logins', action='store_true', help='verify the password on every request')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write results to this JSON file')
+    args = parser.parse_args()
+
+    results = {mode: bench(mode, args) for mode in ('sync', 'async')}
+
+    print(f'{args.concurrency} requests in flight, sync process with {args.sync_workers} workers, '
+          f'{args.auth} auth{", uncached" if args.uncached_logins else ""}')
+    print(f"{'mode':<8}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for mode, result in results.items():
+        total = result['all']
+        print(f"{mode:<8}{total['requests']:>10}{total['throughput']:>10.1f}{total['p50_ms']:>10.2f}"
+              f"{total['p95_ms']:>10.2f}{total['p99_ms']:>10.2f}{total['errors']:>8}")
+    print(f"async serves {results['async']['all']['throughput'] / results['sync']['all']['throughput']:.1f}x "
+          f"the requests per second")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'revision': git_revision(),
+                    'python': platform.python_version(),
+                    'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                    'cpus': os.cpu_count(),
+                },
+                'args': {key: value for key, value in vars(args).items() if key != 'output'},
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Multi-threaded rental contention against the Flask API.
+
+Every thread rents every book in a random order through
+PUT /api/v1/resources/books/<id>, so each book is fought over by all
+threads. Checks that each book ends up rented exactly once, to the user
+whose request got the 201, and reports rentals/sec.
+
+    python benchmarks/bench_rent_contention.py [--threads 8] [--books 200]
+"""
+import argparse
+import collections
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'book_rental_store_api'))
+
+from argon2 import PasswordHasher  # noqa: E402
+
+from book_rental_store_api import create_app  # noqa: E402
+from book_rental_store_api.db import get_db, init_db  # noqa: E402
+
+
+def seed(app, users, books):
+    with app.app_context():
+        init_db()
+        db = get_db()
+        password = "argon2" + PasswordHasher().hash('password')
+        db.executemany(
+            'INSERT INTO auth_user (password, is_superuser, username, last_name, email, is_staff, is_active, '
+            'date_joined, first_name) VALUES (?,0,?,"","",0,1,CURRENT_TIMESTAMP,"")',
+            [(password, f'user{i}') for i in range(users)])
+        db.executemany('INSERT INTO books_book (title, author, rental_due_date, days_rented, book_type_id) '
+                       'VALUES (?,?,"",0,1)', [(f'Title {i}', f'Author {i}') for i in range(books)])
+        db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--books', type=int, default=200)
+    args = parser.parse_args()
+
+    db_fd, db_path = tempfile.mkstemp()
+    app = create_app({'DATABASE': db_path, 'SECRET_KEY': 'benchmark', 'DATABASE_POOL_SIZE': args.threads})
+    seed(app, args.threads, args.books)
+
+    tokens = []
+    for i in range(args.threads):
+        rv = app.test_client().post('/api/v1/auth/token', auth=(f'user{i}', 'password'))
+        tokens.append(rv.get_json()['token'])
+
+    winners = collections.defaultdict(list)
+    statuses = collections.Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.threads + 1)
+
+    def renter(user_index):
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {tokens[user_index]}'}
+        book_ids = list(range(1, args.books + 1))
+        random.shuffle(book_ids)
+        barrier.wait()
+        for book_id in book_ids:
+            rv = client.put(f'/api/v1/resources/books/{book_id}', headers=headers, data={'days_to_rent': 3})
+            with lock:
+                statuses[rv.status_code] += 1
+                if rv.status_code == 201:
+                    winners[book_id].append(user_index + 1)
+
+    threads = [threading.Thread(target=renter, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        renters = dict(get_db().execute('SELECT id, renting_user_id FROM books_book').fetchall())
+    app.extensions['db_pool'].close()
+    os.close(db_fd)
+    os.unlink(db_path)
+
+    double_rentals = [book_id for book_id, users in winners.items() if len(users) > 1]
+    wrong_renter = [book_id for book_id, users in winners.items() if renters[book_id] != users[0]]
+    unrented = args.books - len(winners)
+
+    attempts = sum(statuses.values())
+    print(f"threads={args.threads} books={args.books} attempts={attempts} elapsed={elapsed:.2f}s")
+    print(f"status codes: {dict(sorted(statuses.items()))}")
+    print(f"rentals/sec: {len(winners) / elapsed:.1f}  attempts/sec: {attempts / elapsed:.1f}")
+    print(f"double rentals: {len(double_rentals)}  wrong renter: {len(wrong_renter)}  unrented: {unrented}")
+    if double_rentals or wrong_renter or unrented:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
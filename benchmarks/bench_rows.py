@@ -0,0 +1,94 @@
+"""Per-row cost of reading and formatting catalog rows.
+
+Compares the old dict-per-row factory (db.make_dicts) with sqlite3.Row,
+both for fetching rows and for fetching plus format_book().
+
+    python benchmarks/bench_rows.py [--rows 100000] [--repeat 5]
+"""
+import argparse
+import datetime
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'book_rental_store_api'))
+
+from flask import g  # noqa: E402
+
+from book_rental_store_api import books, create_app  # noqa: E402
+from book_rental_store_api.db import make_dicts  # noqa: E402
+from book_rental_store_api.pricing import BOOK_TYPES_QUERY  # noqa: E402
+
+SCHEMA = os.path.join(os.path.dirname(books.__file__), 'schema.sql')
+
+
+def create_catalog(rows):
+    conn = sqlite3.connect(':memory:')
+    with open(SCHEMA) as f:
+        conn.executescript(f.read())
+    due_date = datetime.datetime.now() + datetime.timedelta(days=3)
+    conn.executemany(
+        'INSERT INTO books_book (title, author, rental_due_date, days_rented, renting_user_id, book_type_id, status) '
+        'VALUES (?,?,?,?,?,?,?)',
+        ((f'Title {i}', f'Author {i % 1000}', str(due_date) if i % 2 else '', 3 if i % 2 else 0,
+          i % 50 if i % 2 else None, i % 3 + 1, 'rented' if i % 2 else 'available') for i in range(rows)))
+    conn.commit()
+    return conn
+
+
+def request_context(conn):
+    """A pushed request context with the book type cache primed from conn."""
+    ctx = create_app({'DATABASE': ':memory:', 'SECRET_KEY': 'benchmark'}).test_request_context()
+    ctx.push()
+    g.book_types = {row[0]: dict(zip(('id', 'book_type', 'rental_rate', 'min_days', 'min_days_rate'), row))
+                    for row in conn.execute(BOOK_TYPES_QUERY)}
+    return ctx
+
+
+NOW = books.MINUTE_PRECISION.sub('', str(datetime.datetime.now()))
+
+
+def fetch(conn):
+    return conn.execute(books.BASE_QUERY, [NOW]).fetchall()
+
+
+def fetch_and_format(conn):
+    book_types = g.book_types
+    return [books.format_book(book, 7, book_types) for book in conn.execute(books.BASE_QUERY, [NOW])]
+
+
+def measure(conn, factory, fn, rows, repeat):
+    conn.row_factory = factory
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(conn)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = fn(conn)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return best / rows * 1e6, peak / rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    conn = create_catalog(args.rows)
+    request_context(conn)
+    print(f"{'benchmark':<20}{'row factory':<16}{'us/row':>10}{'peak B/row':>12}")
+    for name, fn in [('fetch', fetch), ('fetch+format_book', fetch_and_format)]:
+        for label, factory in [('make_dicts', make_dicts), ('sqlite3.Row', sqlite3.Row)]:
+            per_row, peak = measure(conn, factory, fn, args.rows, args.repeat)
+            print(f"{name:<20}{label:<16}{per_row:>10.3f}{peak:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Render time of the Django catalog page with cold versus warm book card caches.
+
+Seeds a throwaway database, then renders BooksView for one page of
+--per-page books. Cold renders clear the cache first, so every card is
+rendered and stored; warm renders reuse the cached cards.
+
+    python benchmarks/bench_templates.py [--books 2000] [--per-page 1000] [--renders 20]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'book_rental_store'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'book_rental_store.settings')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+# Benchmark the cached template loader production uses
+os.environ.setdefault('DEBUG', 'False')
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+
+def render(view, request):
+    start = time.perf_counter()
+    view(request).render()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=2000)
+    parser.add_argument('--per-page', type=int, default=1000)
+    parser.add_argument('--renders', type=int, default=20)
+    args = parser.parse_args()
+
+    django.setup()
+    db_fd, db_path = tempfile.mkstemp(suffix='.sqlite3')
+    settings.DATABASES['default']['NAME'] = db_path
+
+    from django.contrib.auth.models import AnonymousUser
+    from django.core.cache import cache
+    from django.core.management import call_command
+    from django.test import RequestFactory
+    from books.models import Book, BookType
+    from books.views import BooksView
+
+    try:
+        call_command('migrate', verbosity=0)
+        book_types = list(BookType.objects.all())
+        Book.objects.bulk_create([Book(title=f'Title {i}', author=f'Author {i % 100}',
+                                       book_type=book_types[i % len(book_types)]) for i in range(args.books)])
+
+        view = BooksView.as_view(paginate_by=args.per_page)
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        render(view, request)
+
+        cold = []
+        for _ in range(args.renders):
+            cache.clear()
+            cold.append(render(view, request))
+        warm = [render(view, request) for _ in range(args.renders)]
+    finally:
+        from django.db import connections
+        connections.close_all()
+        os.close(db_fd)
+        os.unlink(db_path)
+
+    print(f'{args.per_page} cards per page, {args.renders} renders each')
+    for name, times in (('cold', cold), ('warm', warm)):
+        print(f'{name:<6}median {statistics.median(times) * 1000:8.2f}ms   min {min(times) * 1000:8.2f}ms')
+    print(f'warm cache is {statistics.median(cold) / statistics.median(warm):.1f}x faster')
+
+
+if __name__ == '__main__':
+    main()
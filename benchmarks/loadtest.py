@@ -0,0 +1,342 @@
+"""HTTP load test for the Flask API or the Django site with latency percentiles.
+
+Seeds a throwaway SQLite database (schema.sql for the API, migrations for
+Django), then replays a fixed, seeded mix of catalog, book detail, rental
+and my-books requests at a fixed concurrency. Requests go either straight
+into the WSGI application in-process, or over loopback HTTP to a local
+threaded wsgiref server. Reports throughput and p50/p95/p99 latency,
+status codes and errors per endpoint.
+
+    python benchmarks/loadtest.py --target flask --concurrency 8 --requests 5000
+    python benchmarks/loadtest.py --target django --server http --mix catalog=70,detail=30
+
+The same arguments and --seed always replay the same requests, so --output
+files from different commits can be compared directly.
+"""
+import argparse
+import datetime
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import secrets
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wsgiref.simple_server
+
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+DEFAULT_MIX = 'catalog=50,detail=30,rent=5,mybooks=15'
+
+
+class FlaskTarget():
+    """The API, authenticating each virtual user with a bearer token or basic auth."""
+
+    def __init__(self, db_path, books, users, auth, config=None):
+        sys.path.insert(0, os.path.join(ROOT, 'book_rental_store_api'))
+        from argon2 import PasswordHasher
+        from book_rental_store_api import create_app
+        from book_rental_store_api.db import get_db, init_db
+
+        self.app = create_app({'DATABASE': db_path, 'SECRET_KEY': 'loadtest', **(config or {})})
+        with self.app.app_context():
+            init_db()
+            db = get_db()
+            password = "argon2" + PasswordHasher().hash('password')
+            db.executemany(
+                'INSERT INTO auth_user (password, is_superuser, username, last_name, email, is_staff, is_active, '
+                'date_joined, first_name) VALUES (?,0,?,"","",0,1,CURRENT_TIMESTAMP,"")',
+                [(password, f'user{i}') for i in range(users)])
+            db.executemany('INSERT INTO books_book (title, author, rental_due_date, days_rented, book_type_id) '
+                           'VALUES (?,?,"",0,?)',
+                           [(f'Title {i}', f'Author {i % 100}', i % 3 + 1) for i in range(books)])
+            db.commit()
+
+        client = self.app.test_client()
+        self.headers = []
+        for i in range(users):
+            if auth == 'token':
+                rv = client.post('/api/v1/auth/token', auth=(f'user{i}', 'password'))
+                self.headers.append({'Authorization': f"Bearer {rv.get_json()['token']}"})
+            else:
+                credentials = EnvironBuilder(auth=(f'user{i}', 'password')).headers['Authorization']
+                self.headers.append({'Authorization': credentials})
+
+    def request(self, endpoint, book_id, user, days):
+        headers = self.headers[user]
+        if endpoint == 'catalog':
+            return 'GET', '/api/v1/resources/books?limit=50', headers, None
+        if endpoint == 'detail':
+            return 'GET', f'/api/v1/resources/books/{book_id}', headers, None
+        if endpoint == 'rent':
+            return 'PUT', f'/api/v1/resources/books/{book_id}', \
+                {**headers, 'Content-Type': 'application/x-www-form-urlencoded'}, f'days_to_rent={days}'
+        return 'GET', '/api/v1/resources/books/mybooks', headers, None
+
+    def close(self):
+        if 'db_writer' in self.app.extensions:
+            self.app.extensions['db_writer'].close()
+        self.app.extensions['db_pool'].close()
+
+
+class DjangoTarget():
+    """The site, with each virtual user holding a logged in session and CSRF token."""
+
+    def __init__(self, db_path, books, users, auth):
+        sys.path.insert(0, os.path.join(ROOT, 'book_rental_store'))
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'book_rental_store.settings')
+        os.environ.setdefault('SECRET_KEY', 'loadtest')
+        import django
+        from django.conf import settings
+
+        django.setup()
+        # Point at the throwaway database before anything connects, and
+        # don't let DEBUG record every query for the length of the run
+        settings.DATABASES['default']['NAME'] = db_path
+        settings.DEBUG = False
+
+        from django.contrib.auth.hashers import make_password
+        from django.contrib.auth.models import User
+        from django.core.management import call_command
+        from django.core.wsgi import get_wsgi_application
+        from django.test import Client
+        from books.models import Book, BookType
+
+        call_command('migrate', verbosity=0)
+        password = make_password('password')
+        User.objects.bulk_create([User(username=f'user{i}', password=password) for i in range(users)])
+        book_types = list(BookType.objects.all())
+        Book.objects.bulk_create([Book(title=f'Title {i}', author=f'Author {i % 100}',
+                                       book_type=book_types[i % len(book_types)]) for i in range(books)])
+
+        self.app = get_wsgi_application()
+        self.headers = []
+        for user in User.objects.order_by('id'):
+            client = Client()
+            client.force_login(user)
+            csrf_token = secrets.token_hex(16)
+            self.headers.append({
+                'Cookie': f"sessionid={client.cookies['sessionid'].value}; csrftoken={csrf_token}",
+                'X-CSRFToken': csrf_token,
+            })
+
+    def request(self, endpoint, book_id, user, days):
+        headers = self.headers[user]
+        if endpoint == 'catalog':
+            return 'GET', '/', headers, None
+        if endpoint == 'detail':
+            return 'GET', f'/{book_id}', headers, None
+        if endpoint == 'rent':
+            return 'POST', f'/{book_id}/rent', \
+                {**headers, 'Content-Type': 'application/x-www-form-urlencoded'}, f'days_rented={days}'
+        return 'GET', '/mybooks', headers, None
+
+    def close(self):
+        from django.db import connections
+        connections.close_all()
+
+
+TARGETS = {'flask': FlaskTarget, 'django': DjangoTarget}
+
+
+class InProcessTransport():
+
+    def __init__(self, app):
+        self.app = app
+
+    def send(self, method, path, headers, body):
+        environ = EnvironBuilder(path=path, method=method, headers=headers, data=body).get_environ()
+        _, status, _ = run_wsgi_app(self.app, environ, buffered=True)
+        return int(status.split(' ', 1)[0])
+
+
+class QuietHandler(wsgiref.simple_server.WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, wsgiref.simple_server.WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class HTTPTransport():
+    """A threaded wsgiref server on a free loopback port."""
+
+    def __init__(self, app):
+        self.server = wsgiref.simple_server.make_server('127.0.0.1', 0, app, ThreadingWSGIServer, QuietHandler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def send(self, method, path, headers, body):
+        # wsgiref speaks HTTP/1.0, so every request gets its own connection
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        finally:
+            conn.close()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        endpoint, _, weight = part.partition('=')
+        if endpoint not in ('catalog', 'detail', 'rent', 'mybooks'):
+            raise argparse.ArgumentTypeError(f'unknown endpoint {endpoint!r}')
+        weights[endpoint] = float(weight or 1)
+    return weights
+
+
+def make_plan(mix, count, books, users, seed):
+    rng = random.Random(seed)
+    endpoints = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    return [(endpoint, rng.randint(1, books), rng.randrange(users), rng.randint(1, 29)) for endpoint in endpoints]
+
+
+def percentile(latencies, pct):
+    if not latencies:
+        return 0.0
+    # Nearest rank: the smallest latency at least pct percent of samples are at or below
+    return latencies[max(0, math.ceil(pct / 100 * len(latencies)) - 1)]
+
+
+def run(target, transport, plan, concurrency):
+    """Send every request in plan from concurrency threads, returning samples and wall time."""
+    samples = []
+    lock = threading.Lock()
+    requests = iter(plan)
+
+    def worker():
+        local = []
+        while True:
+            with lock:
+                item = next(requests, None)
+            if item is None:
+                break
+            endpoint = item[0]
+            method, path, headers, body = target.request(*item)
+            start = time.perf_counter()
+            try:
+                status = transport.send(method, path, headers, body)
+            except Exception as e:
+                status = type(e).__name__
+            local.append((endpoint, status, time.perf_counter() - start))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - start
+
+
+def summarise(samples, elapsed):
+    by_endpoint = {}
+    for endpoint, status, latency in samples:
+        by_endpoint.setdefault(endpoint, []).append((status, latency))
+    by_endpoint = dict(sorted(by_endpoint.items()))
+    by_endpoint['all'] = [(status, latency) for _, status, latency in samples]
+
+    results = {}
+    for endpoint, endpoint_samples in by_endpoint.items():
+        latencies = sorted(latency for _, latency in endpoint_samples)
+        statuses = {}
+        for status, _ in endpoint_samples:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 500)
+        results[endpoint] = {
+            'requests': len(endpoint_samples),
+            'throughput': len(endpoint_samples) / elapsed,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'errors': errors,
+            'error_rate': errors / len(endpoint_samples),
+            'statuses': statuses,
+        }
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', choices=list(TARGETS), default='flask')
+    parser.add_argument('--server', choices=['inprocess', 'http'], default='inprocess')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help=f'endpoint=weight pairs (default {DEFAULT_MIX})')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=100, help='requests sent before measuring')
+    parser.add_argument('--books', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--auth', choices=['token', 'basic'], default='token', help='API authentication')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write results to this JSON file')
+    args = parser.parse_args()
+
+    db_fd, db_path = tempfile.mkstemp(suffix='.sqlite3')
+    target = TARGETS[args.target](db_path, args.books, args.users, args.auth)
+    transport = HTTPTransport(target.app) if args.server == 'http' else InProcessTransport(target.app)
+    try:
+        run(target, transport, make_plan(args.mix, args.warmup, args.books, args.users, args.seed - 1),
+            args.concurrency)
+        samples, elapsed = run(target, transport,
+                               make_plan(args.mix, args.requests, args.books, args.users, args.seed),
+                               args.concurrency)
+    finally:
+        if args.server == 'http':
+            transport.close()
+        target.close()
+        os.close(db_fd)
+        os.unlink(db_path)
+
+    results = summarise(samples, elapsed)
+    print(f'{args.target} ({args.server}), {args.concurrency} threads, {len(samples)} requests in {elapsed:.2f}s')
+    print(f"{'endpoint':<10}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'errors':>8}  statuses")
+    for endpoint, result in results.items():
+        statuses = ' '.join(f'{status}:{count}' for status, count in sorted(result['statuses'].items()))
+        print(f"{endpoint:<10}{result['requests']:>10}{result['throughput']:>10.1f}{result['p50_ms']:>10.2f}"
+              f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['errors']:>8}  {statuses}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'revision': git_revision(),
+                    'python': platform.python_version(),
+                    'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                    'args': {key: value for key, value in vars(args).items() if key != 'output'},
+                },
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
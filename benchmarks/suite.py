@@ -0,0 +1,253 @@
+"""Micro-benchmarks for the API and Django model hot functions.
+
+Times format_book, is_available, rental_charge and make_dicts over
+synthetic catalog rows at each requested scale, auth.login in its
+password, cached and token forms, and the Django Book.rental_charge and
+Book.available methods. Reports ops/sec plus tracemalloc peak bytes and
+retained allocations per op, and can compare against an earlier run:
+
+    python benchmarks/suite.py --scale 1k,100k --output bench.json
+    python benchmarks/suite.py --scale 1k,100k --compare bench.json --threshold 10
+
+With --compare, the run exits non-zero if any benchmark's ops/sec dropped
+by more than --threshold percent.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'book_rental_store_api'))
+
+from flask import g  # noqa: E402
+
+from book_rental_store_api import books, create_app  # noqa: E402
+from book_rental_store_api.db import make_dicts  # noqa: E402
+from book_rental_store_api.pricing import BOOK_TYPES_QUERY  # noqa: E402
+
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000, '1M': 1000000}
+SCHEMA = os.path.join(os.path.dirname(books.__file__), 'schema.sql')
+NOW = books.MINUTE_PRECISION.sub('', str(datetime.datetime.now()))
+
+
+def synthetic_catalog(rows):
+    """An in-memory catalog with a mix of available, rented and past due books."""
+    conn = sqlite3.connect(':memory:')
+    with open(SCHEMA) as f:
+        conn.executescript(f.read())
+    now = datetime.datetime.now()
+    due_dates = [str(now + datetime.timedelta(days=3)), str(now - datetime.timedelta(days=3)), '']
+    conn.executemany(
+        'INSERT INTO books_book (title, author, rental_due_date, days_rented, renting_user_id, book_type_id, status) '
+        'VALUES (?,?,?,?,?,?,?)',
+        ((f'Title {i}', f'Author {i % 1000}', due_dates[i % 3], i % 10, i % 50 if i % 3 != 2 else None, i % 3 + 1,
+          'rented' if i % 3 != 2 else 'available') for i in range(rows)))
+    conn.commit()
+    return conn
+
+
+def request_context(conn):
+    """A pushed request context with the book type cache primed from conn."""
+    ctx = create_app({'DATABASE': ':memory:', 'SECRET_KEY': 'benchmark'}).test_request_context()
+    ctx.push()
+    g.book_types = {row[0]: dict(zip(('id', 'book_type', 'rental_rate', 'min_days', 'min_days_rate'), row))
+                    for row in conn.execute(BOOK_TYPES_QUERY)}
+    return ctx
+
+
+def measure(fn, items, repeat):
+    """Best-of-repeat ops/sec for fn over items, plus allocation figures per op."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+
+    # The list holding the results is allocated before measuring, and
+    # tracemalloc's own snapshots are left out, so whatever is retained
+    # belongs to the ops themselves
+    results = [None] * len(items)
+    own = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    results[:] = map(fn, items)
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    before, after = before.filter_traces(own), after.filter_traces(own)
+    retained = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    del results
+
+    ops = len(items)
+    return {
+        'ops': ops,
+        'ops_per_sec': ops / best if best else float('inf'),
+        'allocs_per_op': max(retained, 0) / ops,
+        'peak_bytes_per_op': peak / ops,
+    }
+
+
+def bench_rows(rows, repeat):
+    conn = synthetic_catalog(rows)
+    conn.row_factory = sqlite3.Row
+    catalog = conn.execute(books.BASE_QUERY, [NOW]).fetchall()
+
+    conn.row_factory = None
+    cursor = conn.execute(books.BASE_QUERY, [NOW])
+    tuples = cursor.fetchall()
+
+    ctx = request_context(conn)
+    # As the views call them, with the request's book types looked up once
+    book_types = g.book_types
+    results = {
+        'format_book': measure(lambda book: books.format_book(book, 7, book_types), catalog, repeat),
+        'is_available': measure(books.is_available, catalog, repeat),
+        'rental_charge': measure(lambda book: books.rental_charge(book, book_types), catalog, repeat),
+        'make_dicts': measure(lambda row: make_dicts(cursor, row), tuples, repeat),
+    }
+    ctx.pop()
+    conn.close()
+    return results
+
+
+def bench_login(repeat):
+    from argon2 import PasswordHasher
+    from book_rental_store_api import create_app
+    from book_rental_store_api.auth import issue_token, login
+    from book_rental_store_api.db import get_db, init_db
+
+    db_fd, db_path = tempfile.mkstemp()
+    app = create_app({'DATABASE': db_path, 'SECRET_KEY': 'benchmark'})
+    with app.app_context():
+        init_db()
+        db = get_db()
+        db.execute('INSERT INTO auth_user (password, is_superuser, username, last_name, email, is_staff, '
+                   'is_active, date_joined, first_name) VALUES (?,0,"bench","","",0,1,CURRENT_TIMESTAMP,"")',
+                   ["argon2" + PasswordHasher().hash('password')])
+        db.commit()
+        token = issue_token({'id': 1, 'username': 'bench'})
+
+    def run(header, count, cache=True):
+        with app.test_request_context(headers={'Authorization': header}):
+            app.extensions['credential_cache'].maxsize = 1024 if cache else 0
+            app.extensions['credential_cache'].clear()
+            login()
+            return measure(lambda _: login(), range(count), repeat)
+
+    basic = 'Basic YmVuY2g6cGFzc3dvcmQ='
+    results = {
+        'auth.login[argon2]': run(basic, 10, cache=False),
+        'auth.login[cached]': run(basic, 5000),
+        'auth.login[token]': run(f'Bearer {token}', 5000),
+    }
+    app.extensions['db_pool'].close()
+    os.close(db_fd)
+    os.unlink(db_path)
+    return results
+
+
+def bench_django_models(rows, repeat):
+    try:
+        import django
+    except ImportError:
+        print('Django is not installed, skipping Book model benchmarks', file=sys.stderr)
+        return {}
+
+    sys.path.insert(0, os.path.join(ROOT, 'book_rental_store'))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'book_rental_store.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    django.setup()
+    from django.utils import timezone
+    from books.models import Book, BookType
+
+    book_types = [BookType(pk=1, rental_rate=1.5, min_days=2, min_days_rate=1),
+                  BookType(pk=2, rental_rate=1.5, min_days=3, min_days_rate=1.5),
+                  BookType(pk=3, rental_rate=3, min_days=0, min_days_rate=1)]
+    now = timezone.now()
+    catalog = [Book(pk=i, title=f'Title {i}', book_type=book_types[i % 3], days_rented=i % 10,
+                    rental_due_date=now + timezone.timedelta(days=(i % 3) - 1))
+               for i in range(rows)]
+    return {
+        'Book.rental_charge': measure(Book.rental_charge, catalog, repeat),
+        'Book.available': measure(Book.available, catalog, repeat),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]['ops_per_sec']
+        change = (result['ops_per_sec'] - before) / before * 100
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:<40}{before:>14.0f}{result['ops_per_sec']:>14.0f}{change:>+9.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', default='1k,100k', help=f"comma separated, from {', '.join(SCALES)}")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='JSON file from an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='fail when ops/sec drops by more than this percentage')
+    args = parser.parse_args()
+
+    results = {}
+    for scale in args.scale.split(','):
+        rows = SCALES[scale]
+        for name, result in {**bench_rows(rows, args.repeat), **bench_django_models(rows, args.repeat)}.items():
+            results[f'{name}@{scale}'] = result
+    results.update(bench_login(args.repeat))
+
+    print(f"{'benchmark':<40}{'ops/sec':>14}{'allocs/op':>12}{'peak B/op':>12}")
+    for name, result in results.items():
+        print(f"{name:<40}{result['ops_per_sec']:>14.0f}{result['allocs_per_op']:>12.2f}"
+              f"{result['peak_bytes_per_op']:>12.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'revision': git_revision(),
+                    'python': platform.python_version(),
+                    'sqlite': sqlite3.sqlite_version,
+                    'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                },
+                'results': results,
+            }, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\n{'benchmark':<40}{'baseline':>14}{'current':>14}{'change':>10}")
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold}%")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -25,7 +25,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = config('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = config('DEBUG', default=True, cast=bool)
 
 ALLOWED_HOSTS = ['*']
 
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'books.middleware.QueryCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,12 +56,18 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'book_rental_store.urls'
 
+_template_loaders = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Parse each template once per process unless templates are being edited
+            'loaders': _template_loaders if DEBUG else [('django.template.loaders.cached.Loader', _template_loaders)],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -110,6 +117,28 @@ PASSWORD_HASHERS = [
     'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
 ]
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# LocMemCache is local to each process, and saving a book only drops its
+# card from the cache of the process that saved it.  Other processes keep
+# showing the old card until BOOKS_CARD_CACHE_TIMEOUT, so deployments with
+# several processes should use a shared cache, such as memcached or
+# FileBasedCache, before raising that timeout.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'book-rental-store',
+        # The default of 300 entries would cull book cards before a page of them is reused
+        'OPTIONS': {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=20000, cast=int)},
+    }
+}
+
+# How long rendered book cards are kept; edits invalidate them sooner in the
+# process that made them, and elsewhere only if the cache is shared
+BOOKS_CARD_CACHE_TIMEOUT = config('BOOKS_CARD_CACHE_TIMEOUT', default=60, cast=int)
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -135,6 +164,25 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Requests running more queries than this are logged as warnings
+BOOKS_QUERY_BUDGET = config('BOOKS_QUERY_BUDGET', default=10, cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'books': {
+            'handlers': ['console'],
+            'level': config('BOOKS_LOG_LEVEL', default='WARNING'),
+        },
+    },
+}
+
 LOGIN_REDIRECT_URL = 'my_books'
 LOGIN_URL = 'login' 
 LOGOUT_URL = 'logout'
@@ -1,6 +1,9 @@
 from django.contrib import admin
-from .models import Book, BookType
+from .models import Book, BookType, CatalogVersion, Rental, RentalArchive
 
 # Register your models here.
 admin.site.register(Book)
 admin.site.register(BookType)
+admin.site.register(CatalogVersion)
+admin.site.register(Rental)
+admin.site.register(RentalArchive)
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+
+# Both statements pick the same batch, the oldest expired rentals, inside one transaction
+EXPIRED = 'SELECT id FROM books_rental WHERE due_date < %s ORDER BY due_date, id LIMIT %s'
+ARCHIVE = ('INSERT INTO books_rentalarchive '
+           '(id, book_id, user_id, days_rented, rented_date, due_date, archived_date) '
+           'SELECT id, book_id, user_id, days_rented, rented_date, due_date, %s '
+           f'FROM books_rental WHERE id IN ({EXPIRED})')
+DELETE = f'DELETE FROM books_rental WHERE id IN ({EXPIRED})'
+
+
+class Command(BaseCommand):
+    help = ('Move rentals that expired before the cutoff from books_rental to books_rentalarchive, '
+            'one short transaction per batch. Run it periodically to keep the current rentals table small.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=0,
+                            help='Only archive rentals that expired at least this many days ago.')
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        if options['older_than_days'] < 0:
+            raise CommandError('--older-than-days cannot be negative.')
+
+        start = time.perf_counter()
+        now = timezone.now()
+        count = self.archive(now - timezone.timedelta(days=options['older_than_days']), now, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {count} rentals in {time.perf_counter() - start:.1f}s.'))
+
+    def archive(self, before, now, batch_size):
+        before = connection.ops.adapt_datetimefield_value(before)
+        now = connection.ops.adapt_datetimefield_value(now)
+        count = 0
+        while True:
+            # Short transactions, so renters are never locked out for the whole run
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(ARCHIVE, [now, before, batch_size])
+                cursor.execute(DELETE, [before, batch_size])
+                archived = cursor.rowcount
+            count += archived
+            if archived < batch_size:
+                return count
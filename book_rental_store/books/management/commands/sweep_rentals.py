@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from books.models import Book
+
+
+SWEEP = ('UPDATE books_book SET status = %s WHERE id IN '
+         '(SELECT id FROM books_book WHERE status = %s AND rental_due_date < %s LIMIT %s)')
+
+
+class Command(BaseCommand):
+    help = ('Mark books whose rental has expired available, one short transaction per batch. '
+            'Run it periodically, or pass --interval to keep sweeping.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--interval', type=float,
+                            help='Sweep again every this many seconds instead of exiting.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        if options['interval'] is not None and options['interval'] <= 0:
+            raise CommandError('--interval must be positive.')
+
+        while True:
+            start = time.perf_counter()
+            count = self.sweep(timezone.now(), options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Marked {count} expired rentals available in {time.perf_counter() - start:.1f}s.'))
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
+
+    def sweep(self, now, batch_size):
+        # Availability is already worked out from the due date until the
+        # sweep, so nothing cached changes and the catalog version stays
+        now = connection.ops.adapt_datetimefield_value(now)
+        count = 0
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(SWEEP, [Book.AVAILABLE, Book.RENTED, now, batch_size])
+                swept = cursor.rowcount
+            count += swept
+            if swept < batch_size:
+                return count
@@ -0,0 +1,55 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter():
+    """Database execute wrapper tallying the queries run and the time spent in them."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class QueryCountMiddleware():
+    """Report the number of queries and database time spent on each request.
+
+    The figures are sent back in the X-Query-Count and Server-Timing headers
+    and logged, at warning level when the request goes over
+    BOOKS_QUERY_BUDGET queries.  Put it first in MIDDLEWARE so session and
+    user lookups are counted too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+
+        duration_ms = counter.duration * 1000
+        response['X-Query-Count'] = str(counter.count)
+        response['Server-Timing'] = f'db;dur={duration_ms:.2f};desc="{counter.count} queries"'
+
+        budget = getattr(settings, 'BOOKS_QUERY_BUDGET', None)
+        level = logging.WARNING if budget is not None and counter.count > budget else logging.DEBUG
+        logger.log(level, '%s %s %s: %d queries in %.2fms', request.method, request.path,
+                   response.status_code, counter.count, duration_ms)
+        return response
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0020_auto_20210624_2126'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                '''CREATE VIRTUAL TABLE "books_book_fts" USING fts5(
+                    "title", "author", content="books_book", content_rowid="id", prefix="2 3"
+                )''',
+                '''CREATE TRIGGER "books_book_fts_insert" AFTER INSERT ON "books_book" BEGIN
+                    INSERT INTO "books_book_fts" ("rowid", "title", "author") VALUES (new."id", new."title", new."author");
+                END''',
+                '''CREATE TRIGGER "books_book_fts_delete" AFTER DELETE ON "books_book" BEGIN
+                    INSERT INTO "books_book_fts" ("books_book_fts", "rowid", "title", "author") VALUES ('delete', old."id", old."title", old."author");
+                END''',
+                '''CREATE TRIGGER "books_book_fts_update" AFTER UPDATE OF "title", "author" ON "books_book" BEGIN
+                    INSERT INTO "books_book_fts" ("books_book_fts", "rowid", "title", "author") VALUES ('delete', old."id", old."title", old."author");
+                    INSERT INTO "books_book_fts" ("rowid", "title", "author") VALUES (new."id", new."title", new."author");
+                END''',
+                '''INSERT INTO "books_book_fts" ("books_book_fts") VALUES ('rebuild')''',
+            ],
+            reverse_sql=[
+                'DROP TRIGGER "books_book_fts_update"',
+                'DROP TRIGGER "books_book_fts_delete"',
+                'DROP TRIGGER "books_book_fts_insert"',
+                'DROP TABLE "books_book_fts"',
+            ],
+        ),
+    ]
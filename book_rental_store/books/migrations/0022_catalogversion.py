@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+def create_catalog_version(apps, schema_editor):
+    CatalogVersion = apps.get_model('books', 'CatalogVersion')
+    CatalogVersion.objects.get_or_create(name='catalog')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0021_book_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_catalog_version, migrations.RunPython.noop),
+    ]
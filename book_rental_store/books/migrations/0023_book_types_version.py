@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+def create_book_types_version(apps, schema_editor):
+    CatalogVersion = apps.get_model('books', 'CatalogVersion')
+    CatalogVersion.objects.get_or_create(name='book_types')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0022_catalogversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_book_types_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('books', '0023_book_types_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RentalArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('days_rented', models.PositiveIntegerField()),
+                ('rented_date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('due_date', models.DateTimeField()),
+                ('archived_date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('book', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='books.book')),
+                ('user', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Rental',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('days_rented', models.PositiveIntegerField()),
+                ('rented_date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('due_date', models.DateTimeField()),
+                ('book', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='books.book')),
+                ('user', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='rentalarchive',
+            index=models.Index(fields=['user', 'rented_date'], name='rentalarchive_user_history'),
+        ),
+        migrations.AddIndex(
+            model_name='rentalarchive',
+            index=models.Index(fields=['book', 'rented_date'], name='rentalarchive_book_history'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['user', 'rented_date'], name='rental_user_history'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['book', 'rented_date'], name='rental_book_history'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['due_date'], name='rental_due_date'),
+        ),
+    ]
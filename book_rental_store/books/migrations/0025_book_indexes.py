@@ -0,0 +1,53 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.functions.comparison
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('books', '0024_rental'),
+    ]
+
+    operations = [
+        # book_renting_user_due_date leads with renting_user_id and replaces its
+        # index.  Dropped by hand, since AlterField would rebuild books_book
+        # on SQLite and lose the full text search triggers
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='book',
+                    name='renting_user',
+                    field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    sql='DROP INDEX "books_book_renting_user_id_89fc9a35"',
+                    reverse_sql='CREATE INDEX "books_book_renting_user_id_89fc9a35" ON "books_book" ("renting_user_id")',
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['renting_user', 'rental_due_date', 'book_type', 'days_rented'], name='book_renting_user_due_date'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('renting_user__isnull', False)), fields=['rental_due_date'], name='book_rented_due_date'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(django.db.models.functions.comparison.Collate('title', 'NOCASE'), name='book_title_nocase'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(django.db.models.functions.comparison.Collate('author', 'NOCASE'), name='book_author_nocase'),
+        ),
+        # Without statistics the planner cannot tell that few books are rented
+        migrations.RunSQL(sql='ANALYZE "books_book"', reverse_sql=migrations.RunSQL.noop),
+    ]
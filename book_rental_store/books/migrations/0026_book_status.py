@@ -0,0 +1,59 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:55
+
+import books.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('books', '0025_book_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_rented_due_date',
+        ),
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_renting_user_due_date',
+        ),
+        # Added with SQL, since AddField and AlterField would rebuild
+        # books_book on SQLite and lose the full text search triggers
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='book',
+                    name='status',
+                    field=models.CharField(choices=[('available', 'Available'), ('rented', 'Rented')], default='available', editable=False, max_length=9),
+                ),
+                migrations.AlterField(
+                    model_name='book',
+                    name='renting_user',
+                    field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=books.models.release_rentals, to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    sql=[
+                        '''ALTER TABLE "books_book" ADD COLUMN "status" varchar(9) NOT NULL DEFAULT 'available' ''',
+                        # The next sweep marks any that have expired available
+                        '''UPDATE "books_book" SET "status" = 'rented' WHERE "renting_user_id" IS NOT NULL''',
+                    ],
+                    reverse_sql='ALTER TABLE "books_book" DROP COLUMN "status"',
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('renting_user__isnull', False)), fields=['renting_user', 'rental_due_date', 'book_type', 'days_rented'], name='book_renting_user_due_date'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('status', 'rented')), fields=['rental_due_date'], name='book_rented_due_date'),
+        ),
+        migrations.RunSQL(sql='ANALYZE "books_book"', reverse_sql=migrations.RunSQL.noop),
+    ]
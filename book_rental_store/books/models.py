@@ -1,6 +1,20 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import DecimalField, F, Q, Sum
+from django.db.models.functions import Collate, Greatest
+from django.db.models.signals import post_save
 from django.utils import timezone
 from django.contrib.auth.models import User
+import re
+import threading
+
+
+# Kept the same as book_rental_store_api.util.fts_query in the API, which searches the same index
+def fts_query(text):
+    """Turn free text into an FTS5 query matching every word as a prefix."""
+    words = re.findall(r'\w+', text)
+    if not words:
+        return '""'
+    return ' '.join(f'"{word}"*' for word in words)
 
 
 class BookType(models.Model):
@@ -13,31 +27,225 @@ class BookType(models.Model):
         return self.book_type
 
 
+class BookTypeCache():
+    """Process-local copy of the book types table, keyed by id.
+
+    Saves fetching a book's type along with every book.  The 'book_types'
+    CatalogVersion is bumped whenever a type is saved; the copy is checked
+    against it once per request, the first time a price is needed, and
+    types saved in this process clear it straight away.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.book_types = {}
+        self._lock = threading.Lock()
+        self._checked = threading.local()
+
+    def get(self, pk):
+        if not getattr(self._checked, 'value', False) or pk not in self.book_types:
+            version = CatalogVersion.current(CatalogVersion.BOOK_TYPES)
+            if version != self.version or pk not in self.book_types:
+                with self._lock:
+                    self.book_types = {book_type.pk: book_type for book_type in BookType.objects.all()}
+                    self.version = version
+            self._checked.value = True
+        return self.book_types[pk]
+
+    def expire(self):
+        """Check the version stamp again on the next get() in this thread."""
+        self._checked.value = False
+
+    def clear(self):
+        with self._lock:
+            self.version = None
+            self.book_types = {}
+
+
+book_types = BookTypeCache()
+
+
+class BookQuerySet(models.QuerySet):
+
+    def available(self, now=None):
+        """Books not rented, including rentals that expired since the last sweep."""
+        now = now or timezone.now()
+        return self.filter(Q(status=Book.AVAILABLE) | Q(status=Book.RENTED, rental_due_date__lt=now))
+
+    def rent(self, pk, user, days_rented):
+        """Rent book pk to user if it is available, returning whether it was rented.
+
+        The availability check and the write are a single conditional UPDATE,
+        so concurrent renters cannot both succeed.  The rental is recorded in
+        the same transaction.
+        """
+        now = timezone.now()
+        fields = {
+            'renting_user': user,
+            'days_rented': days_rented,
+            'rental_due_date': now + timezone.timedelta(days=days_rented),
+            'status': Book.RENTED,
+        }
+        with transaction.atomic(using=self.db):
+            if not self.filter(pk=pk).available(now).update(**fields):
+                return False
+            Rental.objects.using(self.db).create(book_id=pk, user=user, days_rented=days_rented,
+                                                 rented_date=now, due_date=fields['rental_due_date'])
+
+        # update() skips model signals, send the one a save() would have
+        post_save.send(sender=self.model, instance=self.get(pk=pk), created=False,
+                       update_fields=frozenset(fields), raw=False, using=self.db)
+        return True
+
+    def total_rental_charge(self):
+        """Sum of Book.rental_charge over the queryset, computed in one query."""
+        charge = Greatest(
+            F('book_type__min_days') * F('book_type__min_days_rate') +
+            F('book_type__rental_rate') * Greatest(F('days_rented') - F('book_type__min_days'), 0),
+            0,
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+        return self.aggregate(total=Sum(charge))['total'] or 0
+
+    def search(self, text):
+        """Filter to books whose title or author match text, best matches first."""
+        return self.extra(
+            tables=['books_book_fts'],
+            where=['books_book_fts.rowid = books_book.id', 'books_book_fts MATCH %s'],
+            params=[fts_query(text)],
+            # Ties broken on id, so pages taken with OFFSET neither repeat nor skip books
+            order_by=['books_book_fts.rank', 'books_book.id'],
+        )
+
+
+def release_rentals(collector, field, sub_objs, using):
+    """on_delete for renting_user, which also marks the user's books available."""
+    models.SET_NULL(collector, field, sub_objs, using)
+    collector.add_field_update(Book._meta.get_field('status'), Book.AVAILABLE, sub_objs)
+
+
 class Book(models.Model):
+    AVAILABLE = 'available'
+    RENTED = 'rented'
+    STATUS_CHOICES = [(AVAILABLE, 'Available'), (RENTED, 'Rented')]
+
     title = models.CharField(max_length=75)
     author = models.CharField(max_length=75)
     book_type = models.ForeignKey('BookType', on_delete=models.PROTECT)
     days_rented = models.PositiveIntegerField(blank=True, null=True)
     rental_due_date = models.DateTimeField(default=timezone.now)
-    renting_user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    renting_user = models.ForeignKey(User, null=True, blank=True, on_delete=release_rentals, db_index=False)
+    # RENTED from renting until the sweep_rentals command sees the rental has
+    # expired, so an expired rental still counts as available, see available()
+    status = models.CharField(max_length=9, choices=STATUS_CHOICES, default=AVAILABLE, editable=False)
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Current rentals by user, covering the rental charge; also serves the foreign key.
+            # Partial indexes only hold the few rented books, and their statistics say so
+            models.Index(fields=['renting_user', 'rental_due_date', 'book_type', 'days_rented'],
+                         name='book_renting_user_due_date', condition=Q(renting_user__isnull=False)),
+            # Rented books by due date, for the rented filter, expired rentals and the sweep
+            models.Index(fields=['rental_due_date'], name='book_rented_due_date', condition=Q(status='rented')),
+            # Title and author filters ignore case
+            models.Index(Collate('title', 'NOCASE'), name='book_title_nocase'),
+            models.Index(Collate('author', 'NOCASE'), name='book_author_nocase'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # A rental that already expired is saved available, as the sweep would mark it
+        rented = self.renting_user_id and self.rental_due_date and self.rental_due_date >= timezone.now()
+        self.status = Book.RENTED if rented else Book.AVAILABLE
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'status'}
+        super().save(*args, **kwargs)
+
     def days_remaining(self):
         delta = self.rental_due_date - timezone.now()
         return max(delta.days, 0)
 
+    @property
+    def pricing(self):
+        """The book's type, from the book type cache unless it was loaded with the book."""
+        if Book.book_type.is_cached(self):
+            return self.book_type
+        return book_types.get(self.book_type_id)
+
     def rental_charge(self):
         if self.days_rented == None:
             raise Exception('Error: days_rented is undefined')
             
-        rental_charge = self.book_type.min_days * self.book_type.min_days_rate + \
-            self.book_type.rental_rate * max(0, self.days_rented - self.book_type.min_days)
+        pricing = self.pricing
+        rental_charge = pricing.min_days * pricing.min_days_rate + \
+            pricing.rental_rate * max(0, self.days_rented - pricing.min_days)
         return max(rental_charge, 0)
     
     def minimum_charge(self):
-        return self.book_type.min_days * self.book_type.min_days_rate
+        pricing = self.pricing
+        return pricing.min_days * pricing.min_days_rate
     
     def available(self):
-        return (self.rental_due_date < timezone.now()) or not self.renting_user
+        return self.status == Book.AVAILABLE or self.rental_due_date < timezone.now()
+
+
+class CatalogVersion(models.Model):
+    """Monotonic counters bumped whenever the data behind a cached view changes."""
+    CATALOG = 'catalog'
+    BOOK_TYPES = 'book_types'
+
+    name = models.CharField(max_length=50, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name} v{self.version}'
+
+    @classmethod
+    def bump(cls, name=CATALOG):
+        if not cls.objects.filter(name=name).update(version=F('version') + 1):
+            cls.objects.get_or_create(name=name, defaults={'version': 1})
+
+    @classmethod
+    def current(cls, name=CATALOG):
+        return cls.objects.filter(name=name).values_list('version', flat=True).first() or 0
+
+
+class BaseRental(models.Model):
+    """A rental of a book, kept after the book is rented again.
+
+    Book holds only the current rental for fast reads.  Rentals live in
+    Rental until they expire, then the archive_rentals command moves them
+    to RentalArchive so the hot table and its indexes stay small.
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=False)
+    user = models.ForeignKey(User, null=True, on_delete=models.SET_NULL, db_index=False)
+    days_rented = models.PositiveIntegerField()
+    rented_date = models.DateTimeField(default=timezone.now)
+    due_date = models.DateTimeField()
+
+    class Meta:
+        abstract = True
+        # Per-user and per-book history, newest last; they also serve the foreign keys
+        indexes = [
+            models.Index(fields=['user', 'rented_date'], name='%(class)s_user_history'),
+            models.Index(fields=['book', 'rented_date'], name='%(class)s_book_history'),
+        ]
+
+    def __str__(self):
+        return f'{self.book_id} to {self.user_id} until {self.due_date}'
+
+
+class Rental(BaseRental):
+
+    class Meta(BaseRental.Meta):
+        indexes = BaseRental.Meta.indexes + [
+            models.Index(fields=['due_date'], name='rental_due_date'),
+        ]
+
+
+class RentalArchive(BaseRental):
+    archived_date = models.DateTimeField(default=timezone.now)
@@ -0,0 +1,36 @@
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.signals import request_started
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Book, BookType, CatalogVersion, book_types
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=BookType)
+@receiver(post_delete, sender=BookType)
+def bump_catalog_version(sender, **kwargs):
+    CatalogVersion.bump()
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_card(sender, instance, **kwargs):
+    """Drop the book's cached catalog card, which shows its title and author."""
+    cache.delete(make_template_fragment_key('book_card', [instance.pk]))
+
+
+@receiver(post_save, sender=BookType)
+@receiver(post_delete, sender=BookType)
+def bump_book_types_version(sender, **kwargs):
+    CatalogVersion.bump(CatalogVersion.BOOK_TYPES)
+    book_types.clear()
+
+
+@receiver(request_started)
+def expire_book_types(sender, **kwargs):
+    # Each request checks the version stamp once, so edits made by other
+    # processes are charged from the next request on
+    book_types.expire()
@@ -1,11 +1,22 @@
 from django.http.response import HttpResponseRedirect
-from django.test import TestCase, client
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from django.urls.base import reverse
 from django.utils import timezone
 import datetime
+import io
+import json
+import os
+import re
+import tempfile
 
-from .models import Book, BookType
+from .models import Book, BookType, CatalogVersion, Rental, RentalArchive, book_types
 
 
 # Helper function for creating a book with various properties
@@ -28,6 +39,20 @@ def create_book_helper(title='', day_diff=None, renting_user='blank', book_type=
                                    book_type=book_type, days_rented=days_rented)
 
 
+class QueryBudgetTestCase(TestCase):
+    """TestCase with an assertion that a request stays within a query budget."""
+
+    def assertQueryBudget(self, budget, method, path, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(path, data)
+        sql = '\n'.join(query['sql'] for query in queries.captured_queries)
+        self.assertLessEqual(len(queries), budget,
+                             f'{method.upper()} {path} ran {len(queries)} queries, budget is {budget}:\n{sql}')
+        # The middleware should have seen every one of them
+        self.assertEqual(response['X-Query-Count'], str(len(queries)))
+        return response
+
+
 ####### MODEL UNIT TESTS ##########
 
 class BookTypeModelTests(TestCase):
@@ -247,6 +272,210 @@ class BookModelTests(TestCase): # pragma: no cover
             BookType.objects.get(id=book_type.id).delete()
 
 
+class CatalogVersionTests(TestCase):
+
+    def test_book_save_bumps_version(self):
+        """
+        Saving a book bumps the catalog version
+        """
+        version = CatalogVersion.current()
+        book = create_book_helper('Test Book')
+        self.assertGreater(CatalogVersion.current(), version)
+
+        version = CatalogVersion.current()
+        book.title = 'New Title'
+        book.save()
+        self.assertEqual(CatalogVersion.current(), version + 1)
+
+
+    def test_book_delete_bumps_version(self):
+        """
+        Deleting a book bumps the catalog version
+        """
+        book = create_book_helper('Test Book')
+        version = CatalogVersion.current()
+        book.delete()
+        self.assertEqual(CatalogVersion.current(), version + 1)
+
+
+    def test_book_type_save_bumps_version(self):
+        """
+        Changing a book type changes prices, so it bumps the catalog version
+        """
+        version = CatalogVersion.current()
+        BookType.objects.create(book_type='Test type')
+        self.assertEqual(CatalogVersion.current(), version + 1)
+
+
+    def test_bump_creates_missing_version(self):
+        """
+        bump() recreates the version row if it is missing
+        """
+        CatalogVersion.objects.all().delete()
+        CatalogVersion.bump()
+        self.assertEqual(CatalogVersion.current(), 1)
+
+
+class LoadCatalogTests(TestCase):
+
+    def load(self, content, suffix, *args):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        self.addCleanup(os.unlink, path)
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        out = io.StringIO()
+        call_command('load_catalog', path, *args, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def index_schema(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT type, name FROM sqlite_master WHERE tbl_name = 'books_book' "
+                           "AND sql IS NOT NULL ORDER BY name")
+            return cursor.fetchall()
+
+
+    def test_load_books_csv(self):
+        """
+        Books load with their type looked up by name, indexes and search intact
+        """
+        BookType.objects.create(book_type='Fiction')
+        schema = self.index_schema()
+        version = CatalogVersion.current()
+        out = self.load('title,author,book_type\nDune,Frank Herbert,fiction\nEmma,Jane Austen,Fiction\n', '.csv',
+                        '--batch-size', '1')
+        self.assertIn('Loaded 2 books', out)
+        self.assertQuerysetEqual(Book.objects.order_by('id'), ['Dune', 'Emma'], transform=str)
+        self.assertTrue(Book.objects.get(title='Dune').available())
+        self.assertEqual(self.index_schema(), schema)
+        self.assertEqual(CatalogVersion.current(), version + 1)
+        self.assertQuerysetEqual(Book.objects.search('austen'), ['Emma'], transform=str)
+
+
+    def test_load_book_types_and_users(self):
+        """
+        Book types and users load from JSON lines, hashing plain passwords
+        """
+        version = CatalogVersion.current(CatalogVersion.BOOK_TYPES)
+        self.load(json.dumps({'book_type': 'Comic', 'rental_rate': 2, 'min_days': 1}) + '\n', '.jsonl',
+                  '--kind', 'book_types')
+        self.assertEqual(CatalogVersion.current(CatalogVersion.BOOK_TYPES), version + 1)
+        book_type = BookType.objects.get(book_type='Comic')
+        self.assertEqual((book_type.rental_rate, book_type.min_days), (2, 1))
+
+        self.load(json.dumps({'username': 'reader', 'password': 'secret', 'is_staff': 'yes'}) + '\n' +
+                  json.dumps({'username': 'other', 'password': 'secret'}) + '\n', '.jsonl',
+                  '--kind', 'users')
+        user = User.objects.get(username='reader')
+        self.assertTrue(user.is_staff)
+        self.assertTrue(user.check_password('secret'))
+        # Each user is salted separately, so shared passwords don't show
+        self.assertNotEqual(user.password, User.objects.get(username='other').password)
+
+
+    def test_load_failure_loads_nothing(self):
+        """
+        A bad record rolls back the whole load
+        """
+        BookType.objects.create(book_type='Fiction')
+        schema = self.index_schema()
+        with self.assertRaisesMessage(CommandError, "Record 2 has unknown book_type 'Poetry'."):
+            self.load('title,author,book_type\nDune,Frank Herbert,Fiction\nEmma,Jane Austen,Poetry\n', '.csv',
+                      '--batch-size', '1')
+        self.assertEqual(Book.objects.count(), 0)
+        self.assertEqual(self.index_schema(), schema)
+
+
+class ArchiveRentalsTests(TestCase):
+
+    def test_archive_expired_rentals(self):
+        """
+        Rentals that expired before the cutoff move to the archive, current ones stay
+        """
+        user = User.objects.create()
+        book = create_book_helper('Test Book')
+        now = timezone.now()
+        for days, offset in ((1, -9), (2, -8), (3, -1), (4, 2)):
+            Rental.objects.create(book=book, user=user, days_rented=days,
+                                  rented_date=now - datetime.timedelta(days=days + 10),
+                                  due_date=now + datetime.timedelta(days=offset))
+        version = CatalogVersion.current()
+
+        out = io.StringIO()
+        call_command('archive_rentals', '--older-than-days', '5', '--batch-size', '1', stdout=out)
+        self.assertIn('Archived 2 rentals', out.getvalue())
+        self.assertQuerysetEqual(Rental.objects.order_by('id'), [3, 4], transform=lambda r: r.days_rented)
+        self.assertQuerysetEqual(RentalArchive.objects.order_by('id'), [1, 2], transform=lambda r: r.days_rented)
+        self.assertEqual(RentalArchive.objects.get(days_rented=1).rented_date, now - datetime.timedelta(days=11))
+        self.assertEqual(CatalogVersion.current(), version)
+
+        call_command('archive_rentals', stdout=out)
+        self.assertQuerysetEqual(Rental.objects.all(), [4], transform=lambda r: r.days_rented)
+
+
+class SweepRentalsTests(TestCase):
+
+    def test_save_sets_status(self):
+        """
+        Books being rented are saved rented, others available
+        """
+        user = User.objects.create()
+        book = create_book_helper('Test Book', 3, user)
+        self.assertEqual(book.status, Book.RENTED)
+        book.renting_user = None
+        book.save(update_fields=['renting_user'])
+        book.refresh_from_db()
+        self.assertEqual(book.status, Book.AVAILABLE)
+
+
+    def test_save_keeps_expired_rental_available(self):
+        """
+        Editing a book whose rental expired leaves it available and out of the sweep
+        """
+        user = User.objects.create()
+        book = create_book_helper('Test Book', 3, user)
+        Book.objects.filter(pk=book.pk).update(rental_due_date=timezone.now() - datetime.timedelta(days=1),
+                                               status=Book.AVAILABLE)
+        book.refresh_from_db()
+        book.title = 'New Title'
+        book.save()
+        book.refresh_from_db()
+        self.assertEqual((book.renting_user, book.status), (user, Book.AVAILABLE))
+
+
+    def test_deleting_user_releases_books(self):
+        user = User.objects.create()
+        book = create_book_helper('Test Book', 3, user)
+        user.delete()
+        book.refresh_from_db()
+        self.assertEqual((book.renting_user, book.status), (None, Book.AVAILABLE))
+
+
+    def test_sweep_expired_rentals(self):
+        """
+        Expired rentals are available before the sweep and marked available by it
+        """
+        user = User.objects.create()
+        book_type = BookType.objects.create()
+        expired = [create_book_helper(f'Expired {i}', -i - 1, user, book_type) for i in range(3)]
+        # Rented before they expired
+        Book.objects.filter(pk__in=[book.pk for book in expired]).update(status=Book.RENTED)
+        expired = list(Book.objects.filter(pk__in=[book.pk for book in expired]).order_by('id'))
+        current = create_book_helper('Current', 3, user, book_type)
+        self.assertQuerysetEqual(Book.objects.available().order_by('id'), expired)
+        self.assertTrue(all(book.available() for book in expired))
+
+        out = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('sweep_rentals', '--batch-size', '2', stdout=out)
+        self.assertIn('Marked 3 expired rentals available', out.getvalue())
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 2)
+        self.assertQuerysetEqual(Book.objects.filter(status=Book.AVAILABLE).order_by('id'), expired)
+        self.assertQuerysetEqual(Book.objects.available().order_by('id'), expired)
+        current.refresh_from_db()
+        self.assertEqual(current.status, Book.RENTED)
+        self.assertFalse(current.available())
+
+
 ####### VIEW UNIT TESTS ##########
 
 class BooksViewTests(TestCase):
@@ -319,6 +548,174 @@ class BooksViewTests(TestCase):
         )
 
 
+    def test_books_view_search(self):
+        """
+        Searching matches word prefixes in the title or author
+        """
+        potter_book = create_book_helper('Harry Potter', -3)
+        pottery_book = create_book_helper('Pottery Basics', -3)
+        create_book_helper('The Hobbit', -3)
+        response = self.client.get(reverse('books'), {'q': 'pot'})
+        self.assertEqual(response.status_code, 200)
+        self.assertQuerysetEqual(
+            response.context['books_list'],
+            [potter_book, pottery_book],
+            ordered=False
+        )
+
+
+    def test_books_view_search_author(self):
+        """
+        Searching matches on author as well as title
+        """
+        book = create_book_helper('The Hobbit', -3)
+        book.author = 'J. R. R. Tolkien'
+        book.save()
+        create_book_helper('Harry Potter', -3)
+        response = self.client.get(reverse('books'), {'q': 'tolkien'})
+        self.assertQuerysetEqual(response.context['books_list'], [book])
+
+
+    def test_books_view_search_ranked(self):
+        """
+        Better matches are listed first
+        """
+        weak_match = create_book_helper('A long title that mentions dragons only once', -3)
+        strong_match = create_book_helper('Dragons', -3)
+        response = self.client.get(reverse('books'), {'q': 'dragons'})
+        self.assertQuerysetEqual(response.context['books_list'], [strong_match, weak_match])
+
+
+    def test_books_view_search_skips_rented(self):
+        """
+        Searching only returns available books
+        """
+        create_book_helper('Rented Dragons', 3, User.objects.create())
+        response = self.client.get(reverse('books'), {'q': 'dragons'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'No available books match')
+        self.assertQuerysetEqual(response.context['books_list'], [])
+
+
+    def test_books_view_paginated(self):
+        """
+        Books are shown a page at a time in a stable order, keeping the search
+        """
+        book_type = BookType.objects.create()
+        books = [create_book_helper(f'Paged Book {i}', -3, book_type=book_type) for i in range(30)]
+        response = self.client.get(reverse('books'))
+        self.assertEqual(response.status_code, 200)
+        self.assertQuerysetEqual(response.context['books_list'], books[:24])
+        self.assertContains(response, 'Page 1 of 2')
+        self.assertContains(response, '?page=2"')
+
+        response = self.client.get(reverse('books'), {'page': 2, 'q': 'paged'})
+        self.assertEqual(len(response.context['books_list']), 6)
+        self.assertContains(response, '?page=1&q=paged')
+
+
+    def test_books_view_search_paginated_ties(self):
+        """
+        Search results that rank the same are paged in id order, so no book
+        is shown twice or skipped
+        """
+        book_type = BookType.objects.create()
+        books = [create_book_helper('Tied Book', -3, book_type=book_type) for i in range(30)]
+        # SQLite's sort happens to keep id order, so check it is asked for too
+        self.assertRegex(str(Book.objects.search('tied').query), r'ORDER BY .*rank.*, .*books_book.*\.id')
+        pages = [self.client.get(reverse('books'), {'q': 'tied', 'page': page}) for page in (1, 2)]
+        self.assertEqual(
+            [book for response in pages for book in response.context['books_list']],
+            books,
+        )
+
+
+class BookTypeCacheTests(TestCase):
+
+    def setUp(self):
+        self.book_type = BookType.objects.create(book_type='Test type', rental_rate=2, min_days=1, min_days_rate=1)
+        self.book = Book.objects.get(pk=create_book_helper('Test Book', book_type=self.book_type, days_rented=3).pk)
+
+
+    def test_pricing_from_cache(self):
+        """
+        A book's charges are worked out from the cache without fetching its type
+        """
+        book_types.get(self.book_type.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.book.rental_charge(), 5)
+            self.assertEqual(self.book.minimum_charge(), 1)
+
+
+    def test_book_type_save_refreshes_cache(self):
+        """
+        Saving a type bumps its version stamp and drops this process's copy
+        """
+        version = CatalogVersion.current(CatalogVersion.BOOK_TYPES)
+        self.assertEqual(self.book.rental_charge(), 5)
+        self.book_type.rental_rate = 3
+        self.book_type.save()
+        self.assertEqual(CatalogVersion.current(CatalogVersion.BOOK_TYPES), version + 1)
+        self.assertEqual(self.book.rental_charge(), 7)
+
+
+    def test_version_stamp_from_other_process(self):
+        """
+        Edits made elsewhere are picked up by the next request once the stamp moves
+        """
+        self.assertEqual(self.book.rental_charge(), 5)
+        BookType.objects.filter(pk=self.book_type.pk).update(rental_rate=3)
+        CatalogVersion.bump(CatalogVersion.BOOK_TYPES)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.book.rental_charge(), 5)
+        request_started.send(sender=None)
+        self.assertEqual(self.book.rental_charge(), 7)
+
+
+class BookCardCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.book_type = BookType.objects.create()
+        self.book = create_book_helper('Old Title', -3, book_type=self.book_type)
+
+
+    def test_cards_are_cached(self):
+        """
+        A rendered card is reused until the book is saved
+        """
+        self.assertContains(self.client.get(reverse('books')), 'Old Title')
+        # update() sends no signals, so the cached card is still served
+        Book.objects.filter(pk=self.book.pk).update(title='New Title')
+        self.assertContains(self.client.get(reverse('books')), 'Old Title')
+
+        self.book.title = 'New Title'
+        self.book.save()
+        self.assertContains(self.client.get(reverse('books')), 'New Title')
+
+
+    def test_rent_invalidates_card(self):
+        """
+        Renting a book sends post_save, which drops its card
+        """
+        self.client.get(reverse('books'))
+        Book.objects.filter(pk=self.book.pk).update(title='New Title')
+        Book.objects.rent(self.book.pk, User.objects.create(), 3)
+        Book.objects.filter(pk=self.book.pk).update(rental_due_date=timezone.now() - datetime.timedelta(days=1))
+        self.assertContains(self.client.get(reverse('books')), 'New Title')
+
+
+    def test_book_type_save_keeps_cards(self):
+        """
+        Cards don't show the book type, so editing one leaves them cached
+        """
+        self.client.get(reverse('books'))
+        Book.objects.filter(pk=self.book.pk).update(title='New Title')
+        self.book_type.rental_rate = 2
+        self.book_type.save()
+        self.assertContains(self.client.get(reverse('books')), 'Old Title')
+
+
 class MyBooksViewTests(TestCase):
     username_test = 'unit-test-user'
     email_test = 'unit@test.com'
@@ -425,6 +822,29 @@ class MyBooksViewTests(TestCase):
         )
 
 
+    def test_mybooks_view_total(self):
+        """
+        The total is the sum of every current rental's charge, across all pages
+        """
+        self.client.force_login(self.user)
+
+        regular = BookType.objects.create(rental_rate=1.5, min_days=2, min_days_rate=1)
+        fiction = BookType.objects.create(rental_rate=3)
+        books = [create_book_helper('Regular Book', 3, self.user, book_type=regular, days_rented=5),
+                 create_book_helper('Short Book', 3, self.user, book_type=regular, days_rented=1),
+                 create_book_helper('Fiction Book', 3, self.user, book_type=fiction, days_rented=4)]
+        books += [create_book_helper(f'Paged Book {i}', 5, self.user, book_type=fiction, days_rented=1)
+                  for i in range(24)]
+        create_book_helper('Past Due Book', -3, self.user, book_type=fiction, days_rented=5)
+
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('my_books'))
+        self.assertEqual(len(response.context['my_books_list']), 24)
+        total = sum(book.rental_charge() for book in books)
+        self.assertEqual(response.context['my_books_total'], total)
+        self.assertContains(response, f'${total:.2f}')
+
+
 class BookDetailViewTests(TestCase):
     username_test = 'unit-test-user'
     email_test = 'unit@test.com'
@@ -553,6 +973,118 @@ class BookDetailViewTests(TestCase):
         self.assertContains(response, "Minimum charge:")
 
 
+class QueryBudgetTests(QueryBudgetTestCase):
+    """
+    Each view runs a fixed number of queries however many books there are.
+    Logged in requests spend two of them loading the session and user.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('unit-test-user', 'unit@test.com', 'unittest')
+        self.other_user = User.objects.create()
+        self.book_types = [BookType.objects.create(min_days=2), BookType.objects.create()]
+        for i in range(30):
+            create_book_helper(f'Available Book {i}', -3, self.other_user, self.book_types[i % 2], days_rented=3)
+            create_book_helper(f'My Book {i}', 3, self.user, self.book_types[i % 2], days_rented=3)
+            create_book_helper(f'Rented Book {i}', 3, self.other_user, self.book_types[i % 2], days_rented=3)
+        # Prices come from the warm book type cache
+        book_types.get(self.book_types[0].pk)
+
+
+    def test_books_view_budget(self):
+        self.assertQueryBudget(2, 'get', reverse('books'))
+        self.assertQueryBudget(2, 'get', reverse('books'), {'q': 'available', 'page': 2})
+        self.client.force_login(self.user)
+        self.assertQueryBudget(4, 'get', reverse('books'))
+
+
+    def test_my_books_view_budget(self):
+        self.client.force_login(self.user)
+        response = self.assertQueryBudget(5, 'get', reverse('my_books'))
+        self.assertEqual(len(response.context['my_books_list']), 24)
+
+
+    def test_book_detail_view_budget(self):
+        self.client.force_login(self.user)
+        for title in ('Available Book 0', 'My Book 0', 'My Book 1', 'Rented Book 0'):
+            book = Book.objects.get(title=title)
+            # One of them checks the book types version stamp for the prices
+            self.assertQueryBudget(4, 'get', reverse('book_detail', args=[book.id]))
+        self.client.logout()
+        self.assertQueryBudget(2, 'get', reverse('book_detail', args=[book.id]))
+
+
+    def test_rent_budget(self):
+        self.client.force_login(self.user)
+        book = Book.objects.get(title='Available Book 0')
+        # Two of each are the savepoint that atomic() becomes inside the test's transaction
+        response = self.assertQueryBudget(8, 'post', reverse('rent', args=[book.id]), {'days_rented': '3'})
+        self.assertEqual(response.status_code, 302)
+        response = self.assertQueryBudget(6, 'post', reverse('rent', args=[book.id]), {'days_rented': '3'})
+        self.assertEqual(response.status_code, 403)
+
+
+    def test_query_count_headers(self):
+        response = self.client.get(reverse('books'))
+        self.assertEqual(response['X-Query-Count'], '2')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=\d+\.\d{2};desc="2 queries"$')
+
+
+    @override_settings(BOOKS_QUERY_BUDGET=1)
+    def test_over_budget_request_logs_warning(self):
+        with self.assertLogs('books.middleware', 'WARNING') as logs:
+            self.client.get(reverse('books'))
+        self.assertEqual(len(logs.output), 1)
+        self.assertRegex(logs.output[0], r'^WARNING:books.middleware:GET /books/ 200: 2 queries in \d+\.\d{2}ms$')
+
+
+class QueryPlanTests(TestCase):
+    """
+    Every filtered statement the views run searches an index instead of
+    scanning a whole table.  The catalog listing reads mostly available
+    books and scans them in id order, so only its search is checked.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('unit-test-user', 'unit@test.com', 'unittest')
+        book_type = BookType.objects.create(min_days=2)
+        for i in range(200):
+            rented = i % 20 == 0
+            create_book_helper(f'Book {i}', 3 if rented else None, self.user if rented else 'blank', book_type,
+                               days_rented=3 if rented else None)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        book_types.get(book_type.pk)
+        self.client.force_login(self.user)
+
+    def assertNoFullScans(self, method, path, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            getattr(self.client, method)(path, data)
+        filtered = [query['sql'] for query in queries.captured_queries
+                    if re.match(r'(SELECT|UPDATE|DELETE)\b.*\bWHERE\b', query['sql'], re.S)]
+        self.assertTrue(filtered)
+        with connection.cursor() as cursor:
+            for sql in filtered:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                for row in cursor.fetchall():
+                    if row[3].startswith('SCAN') and 'VIRTUAL TABLE' not in row[3]:
+                        self.fail(f'{method.upper()} {path} scans with {row[3]}:\n{sql}')
+
+    def test_books_search_plan(self):
+        self.assertNoFullScans('get', reverse('books'), {'q': 'book 1', 'page': 2})
+
+    def test_my_books_plan(self):
+        self.assertNoFullScans('get', reverse('my_books'))
+
+    def test_book_detail_plan(self):
+        self.assertNoFullScans('get', reverse('book_detail', args=[Book.objects.get(title='Book 20').pk]))
+
+    def test_rent_plan(self):
+        book = Book.objects.get(title='Book 7')
+        self.assertNoFullScans('post', reverse('rent', args=[book.pk]), {'days_rented': '3'})
+        self.assertNoFullScans('post', reverse('rent', args=[book.pk]), {'days_rented': '3'})
+
+
 class RentTestCases(TestCase):
     username_test = 'unit-test-user'
     email_test = 'unit@test.com'
@@ -637,3 +1169,47 @@ class RentTestCases(TestCase):
         book = Book.objects.get(id=book.id)
         self.assertEqual(book.days_rented, 10)
         self.assertEqual(book.renting_user, self.user)
+
+
+    def test_rent_records_rental(self):
+        """
+        Every successful rental is recorded, failed ones are not
+        """
+        self.client.force_login(self.user)
+
+        book = create_book_helper('Test Book', -3, days_rented=1)
+        self.client.post(reverse('rent', args=[book.id]), {'days_rented': '10'})
+        self.client.post(reverse('rent', args=[book.id]), {'days_rented': '5'})
+
+        rental = Rental.objects.get()
+        book.refresh_from_db()
+        self.assertEqual((rental.book, rental.user, rental.days_rented), (book, self.user, 10))
+        self.assertEqual(book.status, Book.RENTED)
+        self.assertEqual(rental.due_date, book.rental_due_date)
+
+
+    def test_rent_bumps_catalog_version(self):
+        """
+        Renting sends post_save, so the catalog version is bumped
+        """
+        self.client.force_login(self.user)
+
+        book = create_book_helper('Test Book', -3, days_rented=1)
+        version = CatalogVersion.current()
+        self.client.post(reverse('rent', args=[book.id]), {'days_rented': '10'})
+        self.assertEqual(CatalogVersion.current(), version + 1)
+
+
+    def test_rent_only_updates_available_books(self):
+        """
+        Book.objects.rent() leaves a book rented by someone else untouched
+        """
+        other_user = User.objects.create(username='other')
+        book = create_book_helper('Test Book', 3, other_user, days_rented=3)
+
+        self.assertFalse(Book.objects.rent(book.id, self.user, 10))
+        book = Book.objects.get(id=book.id)
+        self.assertEqual(book.renting_user, other_user)
+        self.assertEqual(book.days_rented, 3)
+
+        self.assertTrue(Book.objects.rent(create_book_helper('Other Book', -3).id, self.user, 10))
@@ -1,40 +1,75 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.template import Context
+from django.template.loader import get_template
 from django.http.response import HttpResponseForbidden, HttpResponseRedirect
 from django.urls import reverse
 from django.shortcuts import get_object_or_404, render
 from django.views import generic
 from django.utils import timezone
 from .models import Book
-from django.db.models import Q
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 
 
+def book_cards(books):
+    """Rendered catalog cards for books, reusing cached ones.
+
+    Cards are fetched with one get_many and only the misses are rendered,
+    under the same keys {% cache %} would use so signals can drop them.
+    """
+    keys = [make_template_fragment_key('book_card', [book.pk]) for book in books]
+    cached = cache.get_many(keys)
+    missing = {}
+    template = get_template('books/book_card.html').template
+    context = Context()
+    cards = []
+    for key, book in zip(keys, books):
+        card = cached.get(key)
+        if card is None:
+            with context.push(book=book):
+                card = missing[key] = template.render(context)
+        cards.append(card)
+    if missing:
+        cache.set_many(missing, settings.BOOKS_CARD_CACHE_TIMEOUT)
+    return cards
+
+
 class BooksView(generic.ListView):
     template_name = 'books/books.html'
     context_object_name = 'books_list'
+    paginate_by = 24
 
     def get_queryset(self):
-        return Book.objects.filter(Q(rental_due_date__lt=timezone.now())
-                                    | Q(renting_user__isnull=True))
+        books = Book.objects.available().only('id', 'title', 'author')
+        if self.request.GET.get('q'):
+            return books.search(self.request.GET['q'])
+        return books.order_by('id')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['q'] = self.request.GET.get('q', '')
+        context['book_cards'] = book_cards(context['books_list'])
+        return context
 
 
 class MyBooksListView(LoginRequiredMixin, generic.ListView):
     template_name = 'books/my_books.html'
     context_object_name = 'my_books_list'
+    paginate_by = 24
 
     def get_queryset(self):
         return Book.objects\
                 .filter(renting_user=self.request.user.id)\
                 .filter(rental_due_date__gte=timezone.now())\
-                .order_by('rental_due_date')
+                .order_by('rental_due_date', 'id')\
+                .only('id', 'title', 'author', 'rental_due_date')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        book_list = Book.objects\
-                .filter(renting_user=self.request.user.id)\
-                .filter(rental_due_date__gte=timezone.now())\
-                .order_by('rental_due_date')
-        context['my_books_total'] = sum([book.rental_charge() for book in book_list.all()])
+        # Totalled over every current rental, not just the page shown
+        context['my_books_total'] = self.object_list.total_rental_charge()
         return context
 
 class BookDetailView(generic.DetailView):
@@ -48,24 +83,15 @@ class BookDetailView(generic.DetailView):
 
 @login_required
 def rent(request, pk):
-    
-    book = get_object_or_404(Book, pk=pk)
 
-    if not book.available():
-        message = ''
-        if book.renting_user == request.user:
+    days_rented = int(request.POST['days_rented'])
+
+    if not Book.objects.rent(pk, request.user, days_rented):
+        book = get_object_or_404(Book.objects.only('renting_user_id'), pk=pk)
+        if book.renting_user_id == request.user.id:
             message = "You're already renting this book."
         else:
             message = "Sorry, someone else is renting this right now."
-        
-        if message:
-            return HttpResponseForbidden(message)
-
-    book.renting_user = request.user
-    
-    days_rented = int(request.POST['days_rented'])
-    book.days_rented = days_rented
-    book.rental_due_date = timezone.now() + timezone.timedelta(days=days_rented)
-    book.save()
+        return HttpResponseForbidden(message)
     
-    return HttpResponseRedirect(reverse('book_detail', args=(book.id,)))
+    return HttpResponseRedirect(reverse('book_detail', args=(pk,)))
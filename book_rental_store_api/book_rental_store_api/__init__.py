@@ -16,6 +16,7 @@ def create_app(test_config=None):
             SECRET_KEY=config('SECRET_KEY'),
             # store the database in the instance folder
             DATABASE='../db.sqlite3',
+            DATABASE_SLOW_QUERY_LOG=os.path.join(app.instance_path, 'slow_queries.log'),
         )
     else:
         # load the test config if passed in
@@ -32,9 +33,40 @@ def create_app(test_config=None):
 
     db.init_app(app)
 
+    # set up request timing and the metrics route
+    from book_rental_store_api import metrics
+
+    metrics.init_app(app)
+
+    # set up the async serving mode's executors
+    from book_rental_store_api import aio
+
+    aio.init_app(app)
+
+    # set up the verified credential cache
+    from book_rental_store_api import auth
+
+    auth.init_app(app)
+
+    # set up the book type pricing cache
+    from book_rental_store_api import pricing
+
+    pricing.init_app(app)
+
+    # register the bulk loading command
+    from book_rental_store_api import loader
+
+    loader.init_app(app)
+
+    # register the rental archive command
+    from book_rental_store_api import rentals
+
+    rentals.init_app(app)
+
     # apply the blueprints to the app
     from book_rental_store_api import books
 
+    app.register_blueprint(auth.bp)
     app.register_blueprint(books.bp)
 
     return app
\ No newline at end of file
@@ -0,0 +1,154 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from flask import current_app
+
+
+class Executors():
+    """Bounded thread pools for the blocking work of the async serving mode.
+
+    Requests run on a wide pool, since SQLite and argon2 both release the
+    GIL while they work and a request blocked on either only parks one
+    thread.  Password verification gets its own pool sized to the CPUs,
+    so a burst of logins queues there instead of oversubscribing the cores
+    and the memory argon2 needs per hash.
+    """
+
+    def __init__(self, request_workers, hash_workers):
+        self.requests = ThreadPoolExecutor(request_workers, thread_name_prefix='api-request')
+        self.hash = ThreadPoolExecutor(hash_workers, thread_name_prefix='api-hash')
+
+    def shutdown(self, wait=True):
+        self.requests.shutdown(wait)
+        self.hash.shutdown(wait)
+
+
+def run_blocking(kind, fn, *args):
+    """Call fn(*args) on the kind executor when serving async, otherwise inline."""
+    executors = current_app.extensions.get('executors')
+    if executors is None:
+        return fn(*args)
+    return getattr(executors, kind).submit(fn, *args).result()
+
+
+class _Instance(WsgiToAsgiInstance):
+    """One request, run on the bounded request executor.
+
+    asgiref runs every request on one shared thread by default, and wraps
+    send in an AsyncToSync that sets up a fresh executor and context for
+    every message.  This hands messages straight to the event loop, which
+    is several times cheaper, and closes the response when done, which is
+    where Flask tears down streamed responses.  Only build_environ is
+    taken from asgiref, the response state is kept here.
+    """
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+        self.response_start = None
+        self.response_started = False
+        self.content_length = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            raise ValueError("WSGI wrapper received a non-HTTP scope")
+        self.scope = scope
+        with SpooledTemporaryFile(max_size=65536) as body:
+            while True:
+                message = await receive()
+                if message['type'] != 'http.request':
+                    raise ValueError("WSGI wrapper received a non-HTTP-request message")
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self.run_wsgi_app, body, send, loop)
+
+    def start_response(self, status, response_headers, exc_info=None):
+        if exc_info is not None:
+            if self.response_started:
+                raise exc_info[1].with_traceback(exc_info[2])
+        elif self.response_start is not None:
+            raise ValueError("You cannot call start_response a second time without exc_info")
+        self.content_length = None
+        headers = []
+        for name, value in response_headers:
+            if name.lower() == 'content-length':
+                self.content_length = int(value)
+            headers.append((name.lower().encode('ascii'), value.encode('ascii')))
+        self.response_start = {'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                               'headers': headers}
+
+    def run_wsgi_app(self, body, send, loop):
+        def sync_send(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        try:
+            environ = self.build_environ(self.scope, body)
+        except ValueError:
+            sync_send({'type': 'http.response.start', 'status': 400, 'headers': [(b'content-type', b'text/plain')]})
+            sync_send({'type': 'http.response.body', 'body': b'Bad Request: Too many duplicate headers'})
+            return
+        response = self.wsgi_application(environ, self.start_response)
+        sent = 0
+        try:
+            for output in response:
+                if not self.response_started:
+                    self.response_started = True
+                    sync_send(self.response_start)
+                # Never more than the Content-Length the application declared
+                if self.content_length is not None:
+                    output = output[:self.content_length - sent]
+                sync_send({'type': 'http.response.body', 'body': output, 'more_body': True})
+                sent += len(output)
+                if sent == self.content_length:
+                    break
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+        if not self.response_started:
+            self.response_started = True
+            sync_send(self.response_start)
+        sync_send({'type': 'http.response.body'})
+
+
+class AsyncApp(WsgiToAsgi):
+    """ASGI application serving a Flask app from the bounded executors.
+
+    One process keeps up to API_ASYNC_REQUEST_WORKERS requests in flight,
+    with password verification limited to API_HASH_WORKERS at a time and
+    database access to the DATABASE_POOL_SIZE pooled connections.
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.app = app
+        self.executors = app.extensions['executors'] = Executors(
+            app.config['API_ASYNC_REQUEST_WORKERS'], app.config['API_HASH_WORKERS'])
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        await _Instance(self.wsgi_application, self.executors.requests)(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executors.shutdown()
+                if 'db_writer' in self.app.extensions:
+                    self.app.extensions['db_writer'].close()
+                self.app.extensions['db_pool'].close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def init_app(app):
+    app.config.setdefault('API_ASYNC_REQUEST_WORKERS', 64)
+    app.config.setdefault('API_HASH_WORKERS', os.cpu_count() or 1)
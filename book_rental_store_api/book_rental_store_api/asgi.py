@@ -0,0 +1,14 @@
+"""
+ASGI entry point for the API's async serving mode.
+
+Serve it with any ASGI server, for example
+
+    uvicorn book_rental_store_api.asgi:application
+
+Requests run on a bounded pool of API_ASYNC_REQUEST_WORKERS threads, see aio.py.
+"""
+
+from book_rental_store_api import create_app
+from book_rental_store_api.aio import AsyncApp
+
+application = AsyncApp(create_app())
@@ -1,15 +1,135 @@
+from book_rental_store_api.aio import run_blocking
 from book_rental_store_api.db import get_db
+from book_rental_store_api.metrics import observe
+from flask import Blueprint
+from flask import current_app
+from flask import jsonify
 from flask import request
 from argon2 import PasswordHasher
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from collections import OrderedDict
 import base64
+import hashlib
+import hmac
+import os
 import re
+import threading
+import time
 
 
+bp = Blueprint("auth", __name__)
+
+password_hasher = PasswordHasher()
+
+TOKEN_SALT = 'book-rental-store-api-token'
+
+
+class CredentialCache():
+    """Bounded, TTL-expiring cache of verified Authorization headers.
+
+    Entries are keyed on an HMAC of the raw header so plaintext credentials
+    are never kept in memory.  Each entry remembers the password hash it was
+    verified against; a hit is only honoured while auth_user still holds
+    that hash, so a password change invalidates the entry immediately.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, auth_header):
+        return hmac.new(self._key, auth_header.encode('utf-8'), hashlib.sha256).digest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, user):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+def get_credential_cache():
+    return current_app.extensions['credential_cache']
+
+
+def get_token_serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=TOKEN_SALT)
+
+
+def issue_token(user):
+    return get_token_serializer().dumps({'id': user['id'], 'username': user['username']})
+
+
+def verify_token(token):
+    try:
+        return get_token_serializer().loads(token, max_age=current_app.config['API_TOKEN_MAX_AGE'])
+    except SignatureExpired:
+        return {'error': "Token expired."}
+    except BadSignature:
+        return {'error': "Invalid token."}
+
 
 def login():
     if "Authorization" not in request.headers:
         return {"error": "Unauthorized"}
-    auth_header = request.headers["Authorization"].replace("Basic", "").strip()
+    raw_header = request.headers["Authorization"]
+
+    start = time.perf_counter()
+    try:
+        if raw_header.startswith("Bearer "):
+            # Signed tokens only need an HMAC check, no database access
+            return verify_token(raw_header[len("Bearer "):].strip())
+
+        return login_with_password(raw_header)
+    finally:
+        observe('auth', time.perf_counter() - start)
+
+
+def login_with_password(raw_header):
+    cache = get_credential_cache()
+    cache_key = cache.key(raw_header)
+    user = cache.get(cache_key)
+    if user is not None:
+        # Cheap primary key lookup instead of an argon2 verify
+        current = get_db().execute(
+            "SELECT password FROM auth_user WHERE id = ?", (user['id'],)
+        ).fetchone()
+        if current is not None and current['password'] == user['password']:
+            return user
+        cache.invalidate(cache_key)
+
+    auth_header = raw_header.replace("Basic", "").strip()
     auth_header = base64.b64decode(auth_header)
     auth_header = auth_header.decode('utf-8')
 
@@ -19,7 +139,7 @@ def login():
     db = get_db()
 
     user = db.execute(
-        "SELECT * FROM auth_user WHERE username = ?", (username,)
+        "SELECT id, username, password FROM auth_user WHERE username = ?", (username,)
     ).fetchone()
 
     if user is None:
@@ -27,10 +147,35 @@ def login():
         return {'error': f"Incorrect username.  To sign up, visit {req_url}accounts/signup"}
     else:
         pwd =  user["password"].replace("argon2", "", 1)
-        ph = PasswordHasher()
         try:
-            ph.verify(pwd, password)
+            run_blocking('hash', password_hasher.verify, pwd, password)
         except:
             return {'error': "Incorrect password."}
 
-    return user
\ No newline at end of file
+    user = dict(user)
+    cache.set(cache_key, user)
+    return user
+
+
+@bp.route("/api/v1/auth/token", methods=['POST'])
+def token():
+    if not request.headers.get("Authorization", "").startswith("Basic "):
+        return jsonify("Please provide a username and password using basic authentication."), 401
+
+    user = login()
+    if 'error' in user:
+        return jsonify(user['error']), 401
+
+    return {
+        'token': issue_token(user),
+        'token_type': 'Bearer',
+        'expires_in': current_app.config['API_TOKEN_MAX_AGE'],
+    }, 201
+
+
+def init_app(app):
+    app.config.setdefault('API_TOKEN_MAX_AGE', 900)
+    app.config.setdefault('AUTH_CACHE_SIZE', 1024)
+    app.config.setdefault('AUTH_CACHE_TTL', 300)
+    app.extensions['credential_cache'] = CredentialCache(
+        app.config['AUTH_CACHE_SIZE'], app.config['AUTH_CACHE_TTL'])
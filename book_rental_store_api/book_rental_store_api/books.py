@@ -1,41 +1,129 @@
 import datetime
+import hashlib
+import time
+from itertools import islice
 from flask import Blueprint
+from flask import current_app
+from flask import g
+from flask import json
 from flask import request
 from flask import jsonify
-from book_rental_store_api.db import query_db, update_db
+from flask import make_response
+from flask import stream_with_context
+from flask import url_for
+from book_rental_store_api.db import catalog_version, iter_db, query_db, write
 from book_rental_store_api.auth import login
+from book_rental_store_api.metrics import observe
+from book_rental_store_api.pricing import get_book_type, get_book_types
+from book_rental_store_api.util import encode_cursor, decode_cursor, fts_query
 import re
 
 
 bp = Blueprint("books", __name__)
 
-BASE_QUERY = "SELECT book.id, book.title, book.author, book.rental_due_date, book.renting_user_id, book.days_rented, \
-              book_type.book_type, book_type.min_days_rate, book_type.min_days, book_type.rental_rate \
-              FROM books_book book \
-              JOIN books_booktype book_type ON book.book_type_id = book_type.id"
+
+class RentalConflict(Exception):
+    pass
+
+
+@bp.record_once
+def init_config(state):
+    state.app.config.setdefault('API_DEFAULT_PAGE_SIZE', 50)
+    state.app.config.setdefault('API_MAX_PAGE_SIZE', 1000)
+    state.app.config.setdefault('API_STREAM_RESPONSES', True)
+    state.app.config.setdefault('API_MAX_BATCH_RENTALS', 100)
+
+
+# A book's status is 'rented' from renting until sweep_rentals sees the rental
+# has expired, so rented books past their due date count as available too.
+# Every query selecting BASE_COLUMNS takes the request's current_minute() as its first parameter
+AVAILABLE = "(book.status = 'available' OR (book.status = 'rented' AND book.rental_due_date < ?))"
+RENTED = "(book.status = 'rented' AND book.rental_due_date >= ?)"
+# Prices come from the book type cache (see pricing.py), not a join
+BASE_COLUMNS = f"book.id, book.title, book.author, book.renting_user_id, book.days_rented, book.book_type_id, \
+              substr(book.rental_due_date, 1, 16) AS due_date, \
+              CASE WHEN {AVAILABLE} THEN 'Available' ELSE 'Rented' END AS status"
+BASE_TABLES = "books_book book"
+BASE_QUERY = f"SELECT {BASE_COLUMNS} FROM {BASE_TABLES}"
+SEARCH_QUERY = f"SELECT {BASE_COLUMNS}, books_book_fts.rank AS rank FROM {BASE_TABLES} \
+              JOIN books_book_fts ON books_book_fts.rowid = book.id"
+
+RENT_QUERY = f"UPDATE books_book AS book SET rental_due_date=?, renting_user_id=?, days_rented=?, status='rented' \
+              WHERE book.id=? AND {AVAILABLE}"
+# books_book only holds the current rental, every rental is also recorded here
+RECORD_RENTAL = "INSERT INTO books_rental (book_id, user_id, days_rented, rented_date, due_date) \
+              VALUES (?, ?, ?, ?, ?)"
+
+# Trims 'YYYY-MM-DD HH:MM:SS.ffffff' timestamps down to the minute
+MINUTE_PRECISION = re.compile(r':[^\.:]*\..*$')
+STATUS_FILTERS = {'available': AVAILABLE, 'rented': RENTED}
+
+# (SQL expression, result column) pairs that define a keyset page order
+BOOK_ORDER = [('book.id', 'id')]
+SEARCH_ORDER = [('books_book_fts.rank', 'rank'), ('book.id', 'id')]
+
 
 @bp.route("/api/v1/resources/books", methods=['GET'])
 def index():
     query = BASE_QUERY
     query_filter_text = []
-    query_fields = []
+    query_fields = [current_minute()]
     book_list = []
+    order = BOOK_ORDER
 
     user = login()
 
+    etag = catalog_etag(user.get('id'))
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+
+    if request.args.get('q'):
+        query = SEARCH_QUERY
+        query_filter_text.append('books_book_fts MATCH ?')
+        query_fields.append(fts_query(request.args.get('q')))
+        order = SEARCH_ORDER
     if request.args.get('title'):
-        query_filter_text.append('title=?')
+        query_filter_text.append('book.title=? COLLATE NOCASE')
         query_fields.append(request.args.get('title'))
     if request.args.get('author'):
-        query_filter_text.append('author=?')
+        query_filter_text.append('book.author=? COLLATE NOCASE')
         query_fields.append(request.args.get('author'))
+    if request.args.get('status'):
+        status = request.args.get('status').lower()
+        if status not in STATUS_FILTERS:
+            return jsonify("Please provide a status of available or rented"), 400
+        query_filter_text.append(STATUS_FILTERS[status])
+        query_fields.append(current_minute())
 
-    if len(query_fields):
+    try:
+        page = get_page_args(order)
+    except ValueError as e:
+        return jsonify(str(e)), 400
+
+    if page and page['after'] is not None:
+        add_keyset_filter(query_filter_text, query_fields, order, page['after'])
+
+    if len(query_filter_text):
         query += ' WHERE ' + ' AND '.join(query_filter_text)
 
-    book_list = [format_book(book, user.get('id')) for book in query_db(query, query_fields)]
+    # Always ordered, filters served from an index would otherwise return rows in index order
+    query += ' ORDER BY ' + ', '.join(column for column, _ in order)
+    if page:
+        query += ' LIMIT ?'
+        query_fields.append(page['limit'] + 1)
+    elif can_stream():
+        return with_etag(stream_books('books', iter_db(query, query_fields), user.get('id')), etag)
+
+    books = query_db(query, query_fields)
+    if page:
+        next_link = get_next_link(books, page['limit'], order)
+        books = books[:page['limit']]
 
-    return {'books': book_list}
+    book_list = format_books(books, user.get('id'))
+
+    if page:
+        return with_etag({'books': book_list, 'next': next_link}, etag)
+    return with_etag({'books': book_list}, etag)
 
 
 @bp.route("/api/v1/resources/books/<int:book_id>", methods=['GET', 'PUT'])
@@ -43,103 +131,337 @@ def show_book(book_id):
     query = f"{BASE_QUERY} WHERE book.id=?"
     
     user = login()
-    if request.method == 'PUT' and 'error' in user:
-        return jsonify(user['error']), 401
+    if request.method == 'PUT':
+        if 'error' in user:
+            return jsonify(user['error']), 401
+        return rent_book(book_id, user)
+
+    etag = catalog_etag(user.get('id'))
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
     
-    books = query_db(query, [book_id])
+    books = query_db(query, [current_minute(), book_id])
 
     if not len(books):
         return jsonify(f'No book found with id {book_id}'), 404
     
-    book = books[0]
-    
-    if request.method == 'GET':
-        return format_book(books[0], user.get('id'))
-    else:
+    return with_etag(format_books(books, user.get('id'))[0], etag)
+
+
+def rent_book(book_id, user):
+    query = f"{BASE_QUERY} WHERE book.id=?"
+
+    try:
         if 'days_to_rent' not in request.values:
-            return jsonify("Please provide days_to_rent in the request body."), 400
-        
+            raise ValueError("Please provide days_to_rent in the request body.")
+        days_to_rent = parse_days_to_rent(request.values.get('days_to_rent'))
+    except ValueError as e:
+        if not query_db("SELECT 1 FROM books_book WHERE id=?", [book_id]):
+            return jsonify(f'No book found with id {book_id}'), 404
+        return jsonify(str(e)), 400
+
+    now = datetime.datetime.now()
+    rented = write(record_rental, book_id, user['id'], days_to_rent, now, current_minute())
+    if not rented:
+        books = query_db(query, [current_minute(), book_id])
+        if not len(books):
+            return jsonify(f'No book found with id {book_id}'), 404
+        if books[0]['renting_user_id'] == user['id']:
+            return jsonify("You're already renting this book."), 403
+        else:
+            return jsonify("Sorry, someone else is renting this right now."), 403
+
+    books = query_db(query, [current_minute(), book_id])
+    return format_books(books, user['id'])[0], 201
+
+
+@bp.route("/api/v1/resources/books/rentals", methods=['POST'])
+def rent_books():
+    user = login()
+    if 'error' in user:
+        return jsonify(user['error']), 401
+
+    body = request.get_json(silent=True)
+    rentals = body.get('rentals') if isinstance(body, dict) else body
+    max_rentals = current_app.config['API_MAX_BATCH_RENTALS']
+    if not isinstance(rentals, list) or not 0 < len(rentals) <= max_rentals:
+        return jsonify(f"Please provide a list of between 1 and {max_rentals} rentals."), 400
+
+    days_by_book = {}
+    for rental in rentals:
+        if not isinstance(rental, dict) or type(rental.get('book_id')) != int:
+            return jsonify("Please provide a book_id and days_to_rent for each rental."), 400
+        if rental['book_id'] in days_by_book:
+            return jsonify(f"Book {rental['book_id']} is listed more than once."), 400
+        # Unlike the form field, JSON is typed, so true or 3.7 is not a number of days
+        days_to_rent = rental.get('days_to_rent')
         try:
-            days_to_rent = int(request.values.get('days_to_rent'))
-        except ValueError:
-            return jsonify("Please provide a days_to_rent between 1 and 30 days"), 400
-            
-        if type(days_to_rent) != int or days_to_rent < 1 or days_to_rent >= 30:
-            return jsonify("Please provide a days_to_rent between 1 and 30 days"), 400
+            days_by_book[rental['book_id']] = parse_days_to_rent(days_to_rent if type(days_to_rent) == int else None)
+        except ValueError as e:
+            return jsonify(str(e)), 400
+
+    book_ids = list(days_by_book)
+    query = f"{BASE_QUERY} WHERE book.id IN ({','.join('?' * len(book_ids))})"
+
+    try:
+        write(record_rentals, days_by_book, user['id'], datetime.datetime.now(), current_minute())
+    except RentalConflict:
+        found = {book['id']: book for book in query_db(query, [current_minute()] + book_ids)}
+        missing = [book_id for book_id in book_ids if book_id not in found]
+        if missing:
+            return jsonify(f"No book found with id {', '.join(map(str, missing))}"), 404
+        unavailable = [book_id for book_id in book_ids if not is_available(found[book_id])]
+        return jsonify(f"Sorry, these books are not available right now: {', '.join(map(str, unavailable))}"), 403
+
+    books = {book['id']: book for book in query_db(query, [current_minute()] + book_ids)}
+    book_list = format_books([books[book_id] for book_id in book_ids], user['id'])
+    book_types = get_book_types()
+    return {
+        'books': book_list,
+        'total_rental_charge': sum(rental_charge(books[book_id], book_types) for book_id in book_ids),
+    }, 201
+
+
+def record_rental(db, book_id, user_id, days_to_rent, now, minute):
+    """Rent a book if it is available at minute and record the rental, returning whether it was rented.
+
+    The availability check and the write are one statement, so two
+    concurrent renters can never both succeed.
+    """
+    due_date = now + datetime.timedelta(days=days_to_rent)
+    rented = db.execute(RENT_QUERY, [due_date, user_id, days_to_rent, book_id, minute]).rowcount
+    if rented:
+        db.execute(RECORD_RENTAL, [book_id, user_id, days_to_rent, now, due_date])
+    return rented
 
-        if not is_available(book):
-            if book['renting_user_id'] == user['id']:
-                return jsonify("You're already renting this book."), 403
-            else:
-                return jsonify("Sorry, someone else is renting this right now."), 403
 
-        due_date = datetime.datetime.now() + datetime.timedelta(days=days_to_rent)
-        update_query = "UPDATE books_book SET rental_due_date=?, renting_user_id=?, days_rented=? WHERE id=?"
-        update_db(update_query, [due_date, user['id'], days_to_rent, books[0]['id']])
+def record_rentals(db, days_by_book, user_id, now, minute):
+    """Rent and record every book, with one compare-and-set each.
 
-        books = query_db(f"{BASE_QUERY} WHERE book.id=?", [book['id']])
-        return format_book(books[0], user['id']), 201
+    Raises RentalConflict, so that none of them are kept, if any one was
+    missing or already rented.
+    """
+    due_dates = {book_id: now + datetime.timedelta(days=days) for book_id, days in days_by_book.items()}
+    rented = db.executemany(
+        RENT_QUERY,
+        [(due_dates[book_id], user_id, days, book_id, minute) for book_id, days in days_by_book.items()]).rowcount
+    if rented != len(days_by_book):
+        raise RentalConflict()
+    db.executemany(
+        RECORD_RENTAL,
+        [(book_id, user_id, days, now, due_dates[book_id]) for book_id, days in days_by_book.items()])
 
 
 @bp.route("/api/v1/resources/books/mybooks", methods=['GET'])
 def my_books():
-    query = f"{BASE_QUERY} WHERE book.renting_user_id=?"
+    query = f"{BASE_QUERY} WHERE book.renting_user_id=? AND book.rental_due_date>=?"
     query_filter_text = []
-    query_fields = []
+    query_fields = [current_minute()]
     book_list = []
 
     user = login()
     if 'error' in user:
         return jsonify(user['error']), 401
 
-    query_fields.append(user.get('id'))
+    etag = catalog_etag(user.get('id'))
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+
+    query_fields.extend([user.get('id'), current_minute()])
 
     if request.args.get('title'):
-        query_filter_text.append('title=?')
+        query_filter_text.append('book.title=? COLLATE NOCASE')
         query_fields.append(request.args.get('title'))
     if request.args.get('author'):
-        query_filter_text.append('author=?')
+        query_filter_text.append('book.author=? COLLATE NOCASE')
         query_fields.append(request.args.get('author'))
 
-    if len(query_fields) > 1:
+    try:
+        page = get_page_args(BOOK_ORDER)
+    except ValueError as e:
+        return jsonify(str(e)), 400
+
+    if page and page['after'] is not None:
+        add_keyset_filter(query_filter_text, query_fields, BOOK_ORDER, page['after'])
+
+    if len(query_filter_text):
         query += ' AND ' + ' AND '.join(query_filter_text)
 
-    book_list = [format_book(book, user.get('id')) 
-                 for book in query_db(query, query_fields)
-                 if not is_available(book)]
+    query += ' ORDER BY book.id'
+    if page:
+        query += ' LIMIT ?'
+        query_fields.append(page['limit'] + 1)
 
-    return {'my_books': book_list}
+    books = query_db(query, query_fields)
+    if page:
+        next_link = get_next_link(books, page['limit'], BOOK_ORDER)
+        books = books[:page['limit']]
 
+    book_list = format_books(books, user.get('id'))
 
-def format_book(book, user_id=None):
-    new_book = {}
-    new_book['id'] = book['id'] 
-    new_book['title'] = book['title'] 
-    new_book['author'] = book['author']
-    new_book['type'] = book['book_type']
-    new_book['rental_minimum_charge'] = book['min_days_rate'] * book['min_days']
-    new_book['rental_minimum_days'] = book['min_days']
-    new_book['regular_rental_charge'] = book['rental_rate']
-    
-    book['rental_due_date'] = re.sub(':[^\.:]*\..*$', '', book['rental_due_date'])
-    if is_available(book):
-        new_book['status'] = 'Available'
+    if page:
+        return with_etag({'my_books': book_list, 'next': next_link}, etag)
+    return with_etag({'my_books': book_list}, etag)
+
+
+def catalog_etag(user_id):
+    """Derive an ETag from everything a books response depends on.
+
+    Responses only change when the catalog version is bumped by a write,
+    when availability flips (which happens on minute boundaries, see
+    current_minute) or for a different user or query, so none of those
+    require reading books_book.
+    """
+    key = f"{catalog_version()}|{current_minute()}|{user_id}|{request.full_path}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def not_modified(etag):
+    return with_etag(current_app.response_class(status=304), etag)
+
+
+def with_etag(rv, etag):
+    response = make_response(rv)
+    response.set_etag(etag, weak=True)
+    response.vary.add('Authorization')
+    return response
+
+
+def parse_days_to_rent(value):
+    try:
+        days_to_rent = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("Please provide a days_to_rent between 1 and 30 days")
+    if days_to_rent < 1 or days_to_rent >= 30:
+        raise ValueError("Please provide a days_to_rent between 1 and 30 days")
+    return days_to_rent
+
+
+def get_page_args(order):
+    """Read keyset pagination arguments from the query string.
+
+    Returns None when the client did not ask for a page, so unpaginated
+    requests keep their original response shape.
+    """
+    if 'limit' not in request.args and 'after' not in request.args:
+        return None
+
+    max_limit = current_app.config['API_MAX_PAGE_SIZE']
+    try:
+        limit = int(request.args.get('limit', current_app.config['API_DEFAULT_PAGE_SIZE']))
+    except ValueError:
+        limit = 0
+    if limit < 1 or limit > max_limit:
+        raise ValueError(f"Please provide a limit between 1 and {max_limit}")
+
+    after = None
+    if request.args.get('after'):
+        after = decode_cursor(request.args['after'], len(order))
+        if type(after[-1]) != int or not all(type(value) in (int, float) for value in after):
+            raise ValueError("Invalid cursor.")
+
+    return {'limit': limit, 'after': after}
+
+
+def add_keyset_filter(query_filter_text, query_fields, order, after):
+    """Restrict a query to rows sorting strictly after the cursor values."""
+    if len(order) == 1:
+        query_filter_text.append(f'{order[0][0]}>?')
+        query_fields.append(after[0])
     else:
-        new_book['status'] = 'Rented'
+        (first, _), (second, _) = order
+        query_filter_text.append(f'({first}>? OR ({first}=? AND {second}>?))')
+        query_fields.extend([after[0], after[0], after[1]])
+
+
+def get_next_link(books, limit, order):
+    if len(books) <= limit:
+        return None
+    last = books[limit - 1]
+    args = request.args.to_dict()
+    args['after'] = encode_cursor(*[last[key] for _, key in order])
+    args['limit'] = limit
+    return url_for(request.endpoint, **args)
+
+
+def can_stream():
+    # Pretty-printed responses are small debugging aids, keep them on jsonify
+    return current_app.config['API_STREAM_RESPONSES'] and not (
+        current_app.debug or current_app.config.get('JSONIFY_PRETTYPRINT_REGULAR'))
+
+
+def stream_books(key, books, user_id, chunk_size=64):
+    """Stream {key: [books]} as it is read from the cursor.
+
+    The bytes are identical to returning the dict from the view, but only
+    chunk_size formatted books are held in memory at a time.
+    """
+    def generate():
+        head = json.dumps({key: []}, separators=(',', ':'))[:-2]
+        separator = ''
+        rows = iter(books)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            # One encode per chunk, with the list's brackets dropped
+            yield head + separator + json.dumps(format_books(chunk, user_id), separators=(',', ':'))[1:-1]
+            head, separator = '', ','
+        yield head + ']}\n'
+
+    mimetype = current_app.config.get('JSONIFY_MIMETYPE', 'application/json')
+    return current_app.response_class(stream_with_context(generate()), mimetype=mimetype)
+
+
+def format_books(books, user_id=None):
+    """Format every book in books, timed as one format phase."""
+    start = time.perf_counter()
+    book_types = get_book_types()
+    book_list = [format_book(book, user_id, book_types) for book in books]
+    observe('format', time.perf_counter() - start)
+    return book_list
+
+
+def format_book(book, user_id=None, book_types=None):
+    book_types = book_types or get_book_types()
+    book_type = get_book_type(book['book_type_id'], book_types)
+    new_book = {
+        'id': book['id'],
+        'title': book['title'],
+        'author': book['author'],
+        'type': book_type['book_type'],
+        'rental_minimum_charge': book_type['min_days_rate'] * book_type['min_days'],
+        'rental_minimum_days': book_type['min_days'],
+        'regular_rental_charge': book_type['rental_rate'],
+    }
+
+    new_book['status'] = book['status']
+    if book['status'] == 'Rented':
         if user_id and user_id == book['renting_user_id']:
-            new_book['due_date'] = book['rental_due_date']
-            new_book['total_rental_charge'] = rental_charge(book)
+            new_book['due_date'] = book['due_date']
+            new_book['total_rental_charge'] = rental_charge(book, book_types)
         else:
-            new_book['available_date'] = book['rental_due_date']
+            new_book['available_date'] = book['due_date']
     
     return new_book
 
 
 def is_available(book):
-    return book['renting_user_id'] is None or book['rental_due_date'] < re.sub(':[^\.:]*\..*$', '', str(datetime.datetime.now()))
+    return book['status'] == 'Available'
+
+
+def current_minute():
+    """The request's "now", at the minute precision availability is decided on.
+
+    Computed once per request so every query and the ETag agree on it.
+    """
+    if 'now' not in g:
+        g.now = MINUTE_PRECISION.sub('', str(datetime.datetime.now()))
+    return g.now
 
 
-def rental_charge(book):
-    rental_charge = book['min_days'] * book['min_days_rate'] + \
-        book['rental_rate'] * max(0, book['days_rented'] - book['min_days'])
+def rental_charge(book, book_types=None):
+    book_type = get_book_type(book['book_type_id'], book_types)
+    rental_charge = book_type['min_days'] * book_type['min_days_rate'] + \
+        book_type['rental_rate'] * max(0, book['days_rented'] - book_type['min_days'])
     return max(rental_charge, 0)
\ No newline at end of file
@@ -1,20 +1,323 @@
+import logging
+import os
+import queue
 import sqlite3
+import threading
+import time
+from concurrent import futures
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
 from flask import g
 from flask import current_app
+from flask import jsonify
 
+from book_rental_store_api.metrics import observe
+
+
+slow_query_logger = logging.getLogger('book_rental_store_api.slow_queries')
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class WriteTimeout(Exception):
+    pass
+
+
+class Connection(sqlite3.Connection):
+    """SQLite connection carrying its pool's slow query log."""
+    slow_query_log = None
+
+
+def param_shape(args):
+    """Describe bound parameters by type alone, e.g. (str, int x3), never by value."""
+    if isinstance(args, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in args.items()) + '}'
+    groups = []
+    for value in args:
+        name = type(value).__name__
+        if groups and groups[-1][0] == name:
+            groups[-1][1] += 1
+        else:
+            groups.append([name, 1])
+    return '(' + ', '.join(name if count == 1 else f'{name} x{count}' for name, count in groups) + ')'
+
+
+def format_plan(rows):
+    """Indent EXPLAIN QUERY PLAN rows into the tree the sqlite3 shell prints."""
+    depths = {}
+    lines = []
+    for node, parent, _, detail in rows:
+        depths[node] = depths.get(parent, -1) + 1
+        lines.append('    ' + '  ' * depths[node] + detail)
+    return '\n'.join(lines)
+
+
+class SlowQueryLog():
+    """Logs statements slower than threshold seconds, with their query plan.
+
+    Plans are captured with EXPLAIN QUERY PLAN the first time each distinct
+    SQL text is slow and reused after that, up to max_plans texts.
+    """
+
+    def __init__(self, threshold, max_plans=256):
+        self.threshold = threshold
+        self.max_plans = max_plans
+        self._plans = {}
+        self._lock = threading.Lock()
+
+    def plan(self, conn, query, args):
+        plan = self._plans.get(query)
+        if plan is None:
+            try:
+                plan = format_plan(conn.execute("EXPLAIN QUERY PLAN " + query, args).fetchall())
+            except sqlite3.Error as e:
+                plan = f"    unavailable: {e}"
+            with self._lock:
+                if len(self._plans) < self.max_plans:
+                    self._plans[query] = plan
+        return plan
+
+    def check(self, conn, query, args, elapsed):
+        if elapsed < self.threshold:
+            return
+        slow_query_logger.warning("Slow query (%.1fms): %s\n  params: %s\n  plan:\n%s",
+                                  elapsed * 1000, ' '.join(query.split()), param_shape(args),
+                                  self.plan(conn, query, args))
 
 
 def make_dicts(cursor, row):
+    """Row factory building a dict per row.
+
+    Connections use the C implemented sqlite3.Row instead, which is indexed
+    by column name the same way without copying every row into a dict; this
+    is kept for callers that need a mutable row.
+    """
     return dict((cursor.description[idx][0], value)
                 for idx, value in enumerate(row))
 
 
+class ConnectionPool():
+    """Thread-safe pool of warmed, reusable SQLite connections.
+
+    Connections are opened lazily up to ``size`` and handed out most
+    recently used first, so busy workers keep reusing the connections whose
+    page cache and prepared statements are hottest.
+    """
+
+    def __init__(self, database, size=5, timeout=30, cached_statements=512, slow_query_log=None):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.slow_query_log = slow_query_log
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._acquisitions = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, check_same_thread=False,
+                               cached_statements=self.cached_statements, factory=Connection)
+        conn.row_factory = sqlite3.Row
+        conn.slow_query_log = self.slow_query_log
+        # Parse the schema up front rather than on the first request
+        conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        return conn
+
+    def acquire(self):
+        start = time.perf_counter()
+        waited = False
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                waited = True
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+
+        wait = time.perf_counter() - start
+        with self._lock:
+            self._acquisitions += 1
+            self._waits += waited
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            # Refreshes the planner's statistics where the queries run showed they are missing or stale
+            conn.execute("PRAGMA optimize")
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'connections': self._created,
+                'idle': self._idle.qsize(),
+                'acquisitions': self._acquisitions,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'wait_seconds_total': self._wait_total,
+                'wait_seconds_max': self._wait_max,
+            }
+
+
+class WriteQueue():
+    """One writer thread that commits the app's catalog writes in groups.
+
+    SQLite lets one connection write at a time, so request threads that
+    commit their own writes queue for the lock inside SQLite, busy waiting
+    and paying for a commit, and its fsync, each.  Here they hand writes to
+    the writer thread instead.  It runs every write queued up by the time it
+    is free, up to max_batch, in one transaction with one commit.  Each write
+    gets a savepoint, so one that raises is undone without undoing the rest.
+    """
+
+    def __init__(self, database, max_batch=64, slow_query_log=None):
+        self.database = database
+        self.max_batch = max_batch
+        self.slow_query_log = slow_query_log
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._writes = 0
+        self._batches = 0
+
+    def submit(self, fn, *args):
+        """Queue fn(conn, *args) and return a future for its result."""
+        future = futures.Future()
+        # Started on first use, so the thread and its connection belong to the serving process
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='api-writer', daemon=True)
+                    self._thread.start()
+        self._queue.put((future, fn, args))
+        return future
+
+    def run(self, fn, *args, timeout=None):
+        """Queue fn(conn, *args) and wait for its committed result.
+
+        Raises WriteTimeout if the write has not started within timeout
+        seconds, withdrawing it.  A write that has started is waited for, so
+        a committed write is never reported as failed.
+        """
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout)
+        except futures.TimeoutError:
+            if future.cancel():
+                raise WriteTimeout(f"Write not started after {timeout}s") from None
+            return future.result()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {'writes': self._writes, 'batches': self._batches, 'queued': self._queue.qsize()}
+
+    def _run(self):
+        conn = sqlite3.connect(self.database, factory=Connection)
+        conn.row_factory = sqlite3.Row
+        conn.slow_query_log = self.slow_query_log
+        try:
+            while True:
+                batch = [self._queue.get()]
+                while batch[-1] is not None and len(batch) < self.max_batch:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stopping = batch[-1] is None
+                if stopping:
+                    batch.pop()
+                # Writes withdrawn by a timed out request are dropped here
+                self._commit(conn, [write for write in batch if write[0].set_running_or_notify_cancel()])
+                if stopping:
+                    return
+        finally:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        if not batch:
+            return
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # total_changes still counts rows a failed write changed before
+            # it was rolled back, so only writes that succeed are counted
+            changed = False
+            for future, fn, args in batch:
+                conn.execute("SAVEPOINT write")
+                changes = conn.total_changes
+                try:
+                    results.append((future, fn(conn, *args), None))
+                    changed = changed or conn.total_changes != changes
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write")
+                    results.append((future, None, e))
+                conn.execute("RELEASE write")
+            if changed:
+                conn.execute(BUMP_CATALOG_VERSION)
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            results = [(future, None, e) for future, _, _ in batch]
+        self._writes += len(batch)
+        self._batches += 1
+        # Only answered once committed
+        for future, result, exception in results:
+            if exception is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exception)
+
+
+def get_pool():
+    return current_app.extensions['db_pool']
+
+
 def get_db():
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = sqlite3.connect(current_app.config['DATABASE'])
-    
-    db.row_factory = make_dicts
+        db = g._database = get_pool().acquire()
     return db
 
 
@@ -27,24 +330,164 @@ def init_db():
 
 
 def query_db(query, args=()):
-    cur = get_db().execute(query, args)
+    conn = get_db()
+    start = time.perf_counter()
+    cur = conn.execute(query, args)
     rv = cur.fetchall()
     cur.close()
+    elapsed = time.perf_counter() - start
+    observe('db', elapsed)
+    if conn.slow_query_log is not None:
+        conn.slow_query_log.check(conn, query, args, elapsed)
     return rv
 
 
-def update_db(query, args=()):
+def iter_db(query, args=(), batch_size=256):
+    """Yield result rows one at a time instead of materialising them all.
+
+    Rows are fetched batch_size at a time, so the time spent in SQLite can
+    be told apart from the time the caller spends on each row.
+    """
+    conn = get_db()
+    start = time.perf_counter()
+    elapsed = 0.0
+    cur = conn.execute(query, args)
+    try:
+        rows = cur.fetchmany(batch_size)
+        elapsed += time.perf_counter() - start
+        while rows:
+            yield from rows
+            start = time.perf_counter()
+            rows = cur.fetchmany(batch_size)
+            elapsed += time.perf_counter() - start
+    finally:
+        cur.close()
+        observe('db', elapsed)
+        if conn.slow_query_log is not None:
+            conn.slow_query_log.check(conn, query, args, elapsed)
+
+
+CATALOG_VERSION_QUERY = "SELECT version FROM books_catalogversion WHERE name = 'catalog'"
+BUMP_CATALOG_VERSION = "UPDATE books_catalogversion SET version = version + 1 WHERE name = 'catalog'"
+
+
+def catalog_version():
+    conn = get_db()
+    start = time.perf_counter()
+    row = conn.execute(CATALOG_VERSION_QUERY).fetchone()
+    observe('db', time.perf_counter() - start)
+    return row['version'] if row else 0
+
+
+@contextmanager
+def transaction():
+    """Run the enclosed statements as one IMMEDIATE transaction.
+
+    The write lock is taken up front so reads inside the block cannot be
+    invalidated by another writer before the block's own writes.  The block
+    commits once on exit, bumping the catalog version if anything changed,
+    and rolls back if it raises.
+    """
     conn = get_db()
-    conn.cursor().execute(query, args)
-    conn.commit()
-    conn.cursor().close()
+    start = time.perf_counter()
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    changes = conn.total_changes
+    try:
+        yield conn
+        if conn.total_changes != changes:
+            conn.execute(BUMP_CATALOG_VERSION)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        observe('db', time.perf_counter() - start)
+
+
+def write(fn, *args):
+    """Run fn(conn, *args) as a catalog write and return its result.
+
+    With DATABASE_WRITE_QUEUE on, the app's writer thread runs it, committed
+    together with other pending writes; otherwise it runs in a transaction()
+    of its own.  Either way, if fn raises nothing it wrote is kept, and the
+    catalog version is bumped in the same commit as its changes.
+    """
+    writer = current_app.extensions.get('db_writer')
+    if writer is None:
+        with transaction() as conn:
+            return fn(conn, *args)
+    start = time.perf_counter()
+    try:
+        return writer.run(fn, *args, timeout=current_app.config['DATABASE_WRITE_TIMEOUT'])
+    finally:
+        observe('db', time.perf_counter() - start)
+
+
+def update_db(query, args=()):
+    """Run a catalog write, bumping the catalog version in the same commit.
+
+    Returns the number of rows the statement changed.
+    """
+    def execute(conn):
+        start = time.perf_counter()
+        rowcount = conn.execute(query, args).rowcount
+        if conn.slow_query_log is not None:
+            conn.slow_query_log.check(conn, query, args, time.perf_counter() - start)
+        return rowcount
+    return write(execute)
 
 
 def close_connection(exception):
-    db = getattr(g, '_database', None)
+    db = g.pop('_database', None)
     if db is not None:
-        db.close()
+        get_pool().release(db)
+
+
+def write_timeout(e):
+    return jsonify("The database is busy, please try again."), 503
+
+
+def add_slow_query_file(path, max_bytes, backups):
+    """Write slow queries to a rotating file at path, once however many apps share it."""
+    if not path:
+        return
+    path = os.path.abspath(path)
+    if any(getattr(handler, 'baseFilename', None) == path for handler in slow_query_logger.handlers):
+        return
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, delay=True)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    slow_query_logger.addHandler(handler)
 
 
 def init_app(app):
-    app.teardown_appcontext(close_connection)
\ No newline at end of file
+    app.config.setdefault('DATABASE_POOL_SIZE', 5)
+    app.config.setdefault('DATABASE_POOL_TIMEOUT', 30)
+    app.config.setdefault('DATABASE_CACHED_STATEMENTS', 512)
+    app.config.setdefault('DATABASE_SLOW_QUERY_SECONDS', 0.1)
+    app.config.setdefault('DATABASE_SLOW_QUERY_LOG', None)
+    app.config.setdefault('DATABASE_SLOW_QUERY_LOG_BYTES', 10 * 1024 * 1024)
+    app.config.setdefault('DATABASE_SLOW_QUERY_LOG_BACKUPS', 5)
+    app.config.setdefault('DATABASE_WRITE_QUEUE', False)
+    app.config.setdefault('DATABASE_WRITE_TIMEOUT', 10)
+    app.config.setdefault('DATABASE_WRITE_BATCH', 64)
+
+    slow_query_log = None
+    if app.config['DATABASE_SLOW_QUERY_SECONDS'] is not None:
+        slow_query_log = SlowQueryLog(app.config['DATABASE_SLOW_QUERY_SECONDS'])
+        add_slow_query_file(app.config['DATABASE_SLOW_QUERY_LOG'], app.config['DATABASE_SLOW_QUERY_LOG_BYTES'],
+                            app.config['DATABASE_SLOW_QUERY_LOG_BACKUPS'])
+
+    app.extensions['db_pool'] = ConnectionPool(
+        app.config['DATABASE'],
+        size=app.config['DATABASE_POOL_SIZE'],
+        timeout=app.config['DATABASE_POOL_TIMEOUT'],
+        cached_statements=app.config['DATABASE_CACHED_STATEMENTS'],
+        slow_query_log=slow_query_log,
+    )
+    app.teardown_appcontext(close_connection)
+
+    if app.config['DATABASE_WRITE_QUEUE']:
+        app.extensions['db_writer'] = WriteQueue(app.config['DATABASE'], max_batch=app.config['DATABASE_WRITE_BATCH'],
+                                                 slow_query_log=slow_query_log)
+        app.register_error_handler(WriteTimeout, write_timeout)
@@ -0,0 +1,208 @@
+import csv
+import datetime
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, repeat
+
+import click
+from flask.cli import with_appcontext
+
+from book_rental_store_api.auth import password_hasher
+from book_rental_store_api.db import transaction
+from book_rental_store_api.pricing import BUMP_BOOK_TYPES_VERSION
+
+
+class LoadError(Exception):
+    pass
+
+
+TABLES = {
+    'books': ('books_book', ('title', 'author', 'rental_due_date', 'days_rented', 'renting_user_id', 'book_type_id',
+                             'status')),
+    'book_types': ('books_booktype', ('book_type', 'rental_rate', 'min_days', 'min_days_rate')),
+    'users': ('auth_user', ('password', 'is_superuser', 'username', 'last_name', 'email', 'is_staff',
+                            'is_active', 'date_joined', 'first_name')),
+}
+
+
+def read_records(path, fmt=None):
+    """Yield one dict per CSV row or JSON line of path."""
+    fmt = fmt or ('csv' if path.endswith('.csv') else 'jsonl')
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def optional(record, field, convert=str, default=None):
+    value = record.get(field)
+    if value is None or value == '':
+        return default
+    return convert(value)
+
+
+def required(record, field, number):
+    value = record.get(field)
+    if value is None or value == '':
+        raise LoadError(f"Record {number} is missing {field}.")
+    return value
+
+
+def to_datetime(value):
+    """Normalise a date and time to the form due dates are stored and compared as text in."""
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value))
+    except ValueError:
+        raise LoadError(f"{value!r} is not a valid date and time") from None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return str(parsed)
+
+
+def book_rows(conn, records):
+    book_types = {row['book_type'].lower(): row['id']
+                  for row in conn.execute("SELECT id, book_type FROM books_booktype")}
+    # Same format Django stores its timezone.now() default in
+    now = str(datetime.datetime.utcnow())
+    for number, record in enumerate(records, 1):
+        book_type_id = optional(record, 'book_type_id', int)
+        if book_type_id is None:
+            name = str(required(record, 'book_type', number))
+            book_type_id = book_types.get(name.lower())
+            if book_type_id is None:
+                raise LoadError(f"Record {number} has unknown book_type {name!r}.")
+        renting_user_id = optional(record, 'renting_user_id', int)
+        yield (
+            required(record, 'title', number),
+            required(record, 'author', number),
+            optional(record, 'rental_due_date', to_datetime, now),
+            optional(record, 'days_rented', int),
+            renting_user_id,
+            book_type_id,
+            'available' if renting_user_id is None else 'rented',
+        )
+
+
+def book_type_rows(conn, records):
+    for number, record in enumerate(records, 1):
+        yield (
+            required(record, 'book_type', number),
+            optional(record, 'rental_rate', float, 1.5),
+            optional(record, 'min_days', int, 0),
+            optional(record, 'min_days_rate', float, 0.0),
+        )
+
+
+def to_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 't', 'yes', 'y')
+    return bool(value)
+
+
+def user_row(numbered, now):
+    number, record = numbered
+    password = optional(record, 'password_hash')
+    if password is None:
+        password = "argon2" + password_hasher.hash(required(record, 'password', number))
+    return (
+        password,
+        optional(record, 'is_superuser', to_bool, False),
+        required(record, 'username', number),
+        optional(record, 'last_name', default=''),
+        optional(record, 'email', default=''),
+        optional(record, 'is_staff', to_bool, False),
+        optional(record, 'is_active', to_bool, True),
+        optional(record, 'date_joined', default=now),
+        optional(record, 'first_name', default=''),
+    )
+
+
+def user_rows(conn, records):
+    now = str(datetime.datetime.utcnow())
+    numbered = enumerate(records, 1)
+    # argon2 is deliberately slow but releases the GIL, so every user gets
+    # their own salted hash on a thread pool, a few records at a time
+    workers = os.cpu_count() or 1
+    with ThreadPoolExecutor(workers, thread_name_prefix='load-hash') as executor:
+        while True:
+            chunk = list(islice(numbered, workers * 4))
+            if not chunk:
+                return
+            yield from executor.map(user_row, chunk, repeat(now, len(chunk)))
+
+
+ROWS = {'books': book_rows, 'book_types': book_type_rows, 'users': user_rows}
+
+
+def drop_indexes(conn, table):
+    """Drop the indexes and triggers on table, returning the SQL to recreate them."""
+    schema = conn.execute(
+        "SELECT type, name, sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') "
+        "AND sql IS NOT NULL", (table,)
+    ).fetchall()
+    for kind, name, _ in schema:
+        conn.execute(f'DROP {kind.upper()} "{name}"')
+    return [sql for _, _, sql in schema]
+
+
+def load(kind, records, batch_size=50000, progress=None):
+    """Insert records into the table for kind, returning how many were loaded.
+
+    Rows go in with one executemany per batch inside a single transaction.
+    The table's indexes and triggers are dropped for the load and rebuilt
+    once at the end, along with the full text search index for books, so a
+    failed load leaves the database as it was.
+    """
+    table, columns = TABLES[kind]
+    insert = f'INSERT INTO "{table}" ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+    count = 0
+    with transaction() as conn:
+        schema = drop_indexes(conn, table)
+        rows = ROWS[kind](conn, records)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            count += conn.executemany(insert, batch).rowcount
+            if progress:
+                progress(count)
+        for sql in schema:
+            conn.execute(sql)
+        if table == 'books_book':
+            conn.execute("INSERT INTO books_book_fts (books_book_fts) VALUES ('rebuild')")
+        elif table == 'books_booktype':
+            conn.execute(BUMP_BOOK_TYPES_VERSION)
+    return count
+
+
+@click.command('load-catalog')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--kind', type=click.Choice(list(TABLES)), default='books', show_default=True)
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+              help='File format, guessed from the extension by default.')
+@click.option('--batch-size', type=click.IntRange(1), default=50000, show_default=True)
+@with_appcontext
+def load_catalog_command(path, kind, fmt, batch_size):
+    """Bulk load books, book types or users from a CSV or JSON lines file."""
+    start = time.perf_counter()
+
+    def progress(count):
+        click.echo(f"{count} {kind} inserted ({time.perf_counter() - start:.1f}s)", err=True)
+
+    try:
+        count = load(kind, read_records(path, fmt), batch_size, progress)
+    except (LoadError, ValueError, sqlite3.Error) as e:
+        raise click.ClickException(f"Nothing loaded: {e}")
+
+    elapsed = time.perf_counter() - start
+    click.echo(f"Loaded {count} {kind} in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f}/s).")
+
+
+def init_app(app):
+    app.cli.add_command(load_catalog_command)
@@ -0,0 +1,148 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from flask import Blueprint
+from flask import current_app
+from flask import request
+from flask.json import JSONEncoder
+
+
+bp = Blueprint("metrics", __name__)
+
+PHASES = ('auth', 'db', 'format', 'encode')
+
+# Upper bounds in seconds, fine grained below a millisecond where most phases land
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram():
+    """Fixed bucket histogram of durations.
+
+    Observing bisects into a preallocated list of counts, so recording a
+    duration costs a lock and two additions.  Counts are per bucket;
+    exposition makes them cumulative as Prometheus expects.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class Metrics():
+    """Per-phase and per-endpoint request timings for one app."""
+
+    def __init__(self):
+        self.phases = {phase: Histogram() for phase in PHASES}
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    def observe_request(self, endpoint, seconds):
+        histogram = self.requests.get(endpoint)
+        if histogram is None:
+            with self._lock:
+                histogram = self.requests.setdefault(endpoint, Histogram())
+        histogram.observe(seconds)
+
+
+# The current request's (Metrics, start time), set for the length of the
+# request; a context variable is far cheaper to read than current_app
+_request = ContextVar('book_rental_store_api.metrics', default=None)
+
+
+def observe(phase, seconds):
+    """Record seconds spent in phase, one of PHASES, if metrics are on."""
+    timing = _request.get()
+    if timing is not None:
+        timing[0].phases[phase].observe(seconds)
+
+
+class TimedJSONEncoder(JSONEncoder):
+    """The app's JSON encoder, timing every encode as the encode phase."""
+
+    def encode(self, o):
+        start = time.perf_counter()
+        try:
+            return super().encode(o)
+        finally:
+            observe('encode', time.perf_counter() - start)
+
+
+def start_timer():
+    _request.set((current_app.extensions['metrics'], time.perf_counter()))
+
+
+def record_request(response):
+    metrics, start = _request.get()
+    if request.endpoint != 'metrics.metrics':
+        metrics.observe_request(request.endpoint or 'unmatched', time.perf_counter() - start)
+    return response
+
+
+def stop_timer(exception):
+    # Streamed responses are still timed until the request context ends
+    _request.set(None)
+
+
+def histogram_lines(name, label, histograms):
+    lines = [f'# TYPE {name} histogram']
+    for value, histogram in histograms.items():
+        counts, total = histogram.snapshot()
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{label}="{value}"}} {total}')
+        lines.append(f'{name}_count{{{label}="{value}"}} {cumulative}')
+    return lines
+
+
+def stat_lines(prefix, stats, counters):
+    lines = []
+    for key, value in stats.items():
+        kind = 'counter' if key in counters else 'gauge'
+        name = f'{prefix}_{key}_total' if kind == 'counter' and not key.endswith('_total') else f'{prefix}_{key}'
+        lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name} {value}')
+    return lines
+
+
+@bp.route("/metrics", methods=['GET'])
+def metrics():
+    """Timings, credential cache, connection pool and writer figures in Prometheus text format."""
+    app_metrics = current_app.extensions['metrics']
+    lines = histogram_lines('api_phase_seconds', 'phase', app_metrics.phases)
+    lines += histogram_lines('api_request_seconds', 'endpoint', dict(sorted(app_metrics.requests.items())))
+    lines += stat_lines('api_credential_cache', current_app.extensions['credential_cache'].stats(),
+                        counters={'hits', 'misses'})
+    lines += stat_lines('api_db_pool', current_app.extensions['db_pool'].stats(),
+                        counters={'acquisitions', 'waits', 'timeouts', 'wait_seconds_total'})
+    if 'db_writer' in current_app.extensions:
+        lines += stat_lines('api_db_writer', current_app.extensions['db_writer'].stats(),
+                            counters={'writes', 'batches'})
+    return current_app.response_class('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    app.config.setdefault('API_METRICS', True)
+    if not app.config['API_METRICS']:
+        return
+    app.extensions['metrics'] = Metrics()
+    app.json_encoder = TimedJSONEncoder
+    app.before_request(start_timer)
+    app.after_request(record_request)
+    app.teardown_request(stop_timer)
+    app.register_blueprint(bp)
@@ -0,0 +1,60 @@
+import threading
+
+from flask import current_app
+from flask import g
+
+from book_rental_store_api.db import get_db
+
+
+BOOK_TYPES_QUERY = "SELECT id, book_type, rental_rate, min_days, min_days_rate FROM books_booktype"
+BOOK_TYPES_VERSION_QUERY = "SELECT version FROM books_catalogversion WHERE name = 'book_types'"
+BUMP_BOOK_TYPES_VERSION = "UPDATE books_catalogversion SET version = version + 1 WHERE name = 'book_types'"
+
+
+class BookTypeCache():
+    """Process-local copy of books_booktype, keyed by id.
+
+    The table is tiny and rarely changes, so catalog queries read book
+    rows alone and look prices up here.  Every writer of books_booktype
+    bumps the 'book_types' version stamp, and the copy is reloaded
+    whenever the stamp has moved.
+    """
+
+    def __init__(self):
+        self.version = -1
+        self.book_types = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, conn, force=False):
+        row = conn.execute(BOOK_TYPES_VERSION_QUERY).fetchone()
+        version = row['version'] if row else 0
+        if force or version != self.version:
+            with self._lock:
+                # Read after the stamp, so a concurrent edit at worst causes one extra reload
+                self.book_types = {row['id']: dict(row) for row in conn.execute(BOOK_TYPES_QUERY)}
+                self.version = version
+        return self.book_types
+
+
+def get_book_types():
+    """Book types by id, checked against the version stamp once per request."""
+    if 'book_types' not in g:
+        g.book_types = current_app.extensions['book_types'].refresh(get_db())
+    return g.book_types
+
+
+def get_book_type(book_type_id, book_types=None):
+    """The book type with book_type_id, from book_types if given.
+
+    Callers formatting many books should look get_book_types() up once and
+    pass it in, since every access to g goes through a context proxy.
+    """
+    book_types = book_types or get_book_types()
+    if book_type_id not in book_types:
+        # Written without bumping the stamp, go back to the table
+        book_types = g.book_types = current_app.extensions['book_types'].refresh(get_db(), force=True)
+    return book_types[book_type_id]
+
+
+def init_app(app):
+    app.extensions['book_types'] = BookTypeCache()
@@ -0,0 +1,101 @@
+import datetime
+import time
+
+import click
+from flask.cli import with_appcontext
+
+from book_rental_store_api.books import MINUTE_PRECISION
+from book_rental_store_api.db import get_db
+
+
+# Both statements pick the same batch, the oldest expired rentals, inside one transaction
+EXPIRED = "SELECT id FROM books_rental WHERE due_date < ? ORDER BY due_date, id LIMIT ?"
+ARCHIVE_RENTALS = f"INSERT INTO books_rentalarchive \
+              (id, book_id, user_id, days_rented, rented_date, due_date, archived_date) \
+              SELECT id, book_id, user_id, days_rented, rented_date, due_date, ? \
+              FROM books_rental WHERE id IN ({EXPIRED})"
+DELETE_ARCHIVED = f"DELETE FROM books_rental WHERE id IN ({EXPIRED})"
+
+SWEEP = "UPDATE books_book SET status = 'available' WHERE id IN \
+              (SELECT id FROM books_book WHERE status = 'rented' AND rental_due_date < ? LIMIT ?)"
+
+
+def archive_rentals(before, batch_size=10000):
+    """Move rentals that expired before the cutoff to books_rentalarchive.
+
+    books_rental keeps only current rentals, so its indexes stay small.
+    Each batch is its own short transaction, so renters are never locked
+    out for the whole run.  Neither table is part of the catalog, so the
+    catalog version is left alone.  Returns how many rentals were moved.
+    """
+    conn = get_db()
+    now = datetime.datetime.now()
+    count = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(ARCHIVE_RENTALS, [now, before, batch_size])
+            archived = conn.execute(DELETE_ARCHIVED, [before, batch_size]).rowcount
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        count += archived
+        if archived < batch_size:
+            return count
+
+
+def sweep_rentals(now, batch_size=1000):
+    """Mark books whose rental expired before now available.
+
+    Reads already count a rented book past its due date as available, so
+    nothing cached changes and the catalog version is left alone.  Each
+    batch is its own short transaction.  Returns how many books were marked.
+    """
+    conn = get_db()
+    count = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            swept = conn.execute(SWEEP, [now, batch_size]).rowcount
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        count += swept
+        if swept < batch_size:
+            return count
+
+
+@click.command('archive-rentals')
+@click.option('--older-than-days', type=click.IntRange(0), default=0, show_default=True,
+              help='Only archive rentals that expired at least this many days ago.')
+@click.option('--batch-size', type=click.IntRange(1), default=10000, show_default=True)
+@with_appcontext
+def archive_rentals_command(older_than_days, batch_size):
+    """Move expired rentals to the rental archive. Run it periodically."""
+    start = time.perf_counter()
+    count = archive_rentals(datetime.datetime.now() - datetime.timedelta(days=older_than_days), batch_size)
+    click.echo(f"Archived {count} rentals in {time.perf_counter() - start:.1f}s.")
+
+
+@click.command('sweep-rentals')
+@click.option('--batch-size', type=click.IntRange(1), default=1000, show_default=True)
+@click.option('--interval', type=click.FloatRange(0, min_open=True),
+              help='Sweep again every this many seconds instead of exiting.')
+@with_appcontext
+def sweep_rentals_command(batch_size, interval):
+    """Mark books whose rental has expired available. Run it periodically or with --interval."""
+    while True:
+        start = time.perf_counter()
+        # Availability is decided to the minute, as in books.current_minute
+        count = sweep_rentals(MINUTE_PRECISION.sub('', str(datetime.datetime.now())), batch_size)
+        click.echo(f"Marked {count} expired rentals available in {time.perf_counter() - start:.1f}s.")
+        if interval is None:
+            return
+        time.sleep(interval)
+
+
+def init_app(app):
+    app.cli.add_command(archive_rentals_command)
+    app.cli.add_command(sweep_rentals_command)
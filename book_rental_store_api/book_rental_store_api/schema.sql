@@ -1,5 +1,9 @@
 DROP TABLE IF EXISTS "auth_user";
 DROP TABLE IF EXISTS "books_book";
+DROP TABLE IF EXISTS "books_book_fts";
+DROP TABLE IF EXISTS "books_catalogversion";
+DROP TABLE IF EXISTS "books_rental";
+DROP TABLE IF EXISTS "books_rentalarchive";
 
 CREATE TABLE IF NOT EXISTS "auth_user" (
     "id" integer NOT NULL PRIMARY KEY AUTOINCREMENT, 
@@ -22,10 +26,32 @@ CREATE TABLE IF NOT EXISTS "books_book" (
     "rental_due_date" datetime NOT NULL, 
     "days_rented" integer unsigned NULL CHECK ("days_rented" >= 0), 
     "renting_user_id" integer NULL REFERENCES "auth_user" ("id") DEFERRABLE INITIALLY DEFERRED, 
-    "book_type_id" bigint NOT NULL REFERENCES "books_booktype" ("id") DEFERRABLE INITIALLY DEFERRED
+    "book_type_id" bigint NOT NULL REFERENCES "books_booktype" ("id") DEFERRABLE INITIALLY DEFERRED, 
+    "status" varchar(9) NOT NULL DEFAULT 'available'
 );
-CREATE INDEX "books_book_renting_user_id_89fc9a35" ON "books_book" ("renting_user_id");
 CREATE INDEX "books_book_book_type_id_ce8b1bf9" ON "books_book" ("book_type_id");
+CREATE INDEX "book_renting_user_due_date" ON "books_book" ("renting_user_id", "rental_due_date", "book_type_id", "days_rented") WHERE "renting_user_id" IS NOT NULL;
+CREATE INDEX "book_rented_due_date" ON "books_book" ("rental_due_date") WHERE "status" = 'rented';
+CREATE INDEX "book_title_nocase" ON "books_book" ("title" COLLATE "NOCASE");
+CREATE INDEX "book_author_nocase" ON "books_book" ("author" COLLATE "NOCASE");
+
+CREATE VIRTUAL TABLE "books_book_fts" USING fts5(
+    "title", 
+    "author", 
+    content="books_book", 
+    content_rowid="id", 
+    prefix="2 3"
+);
+CREATE TRIGGER "books_book_fts_insert" AFTER INSERT ON "books_book" BEGIN
+    INSERT INTO "books_book_fts" ("rowid", "title", "author") VALUES (new."id", new."title", new."author");
+END;
+CREATE TRIGGER "books_book_fts_delete" AFTER DELETE ON "books_book" BEGIN
+    INSERT INTO "books_book_fts" ("books_book_fts", "rowid", "title", "author") VALUES ('delete', old."id", old."title", old."author");
+END;
+CREATE TRIGGER "books_book_fts_update" AFTER UPDATE OF "title", "author" ON "books_book" BEGIN
+    INSERT INTO "books_book_fts" ("books_book_fts", "rowid", "title", "author") VALUES ('delete', old."id", old."title", old."author");
+    INSERT INTO "books_book_fts" ("rowid", "title", "author") VALUES (new."id", new."title", new."author");
+END;
 
 CREATE TABLE IF NOT EXISTS "books_booktype" (
     "id" integer NOT NULL PRIMARY KEY AUTOINCREMENT,
@@ -37,4 +63,37 @@ CREATE TABLE IF NOT EXISTS "books_booktype" (
 
 INSERT INTO "books_booktype" ("book_type",  "rental_rate", "min_days", "min_days_rate") VALUES ("Regular", 1.50, 2, 1.00);
 INSERT INTO "books_booktype" ("book_type",  "rental_rate", "min_days", "min_days_rate") VALUES ("Novel", 1.50, 3, 1.50);
-INSERT INTO "books_booktype" ("book_type",  "rental_rate", "min_days", "min_days_rate") VALUES ("Fiction", 3.00, 0, 1.00);
\ No newline at end of file
+INSERT INTO "books_booktype" ("book_type",  "rental_rate", "min_days", "min_days_rate") VALUES ("Fiction", 3.00, 0, 1.00);
+
+CREATE TABLE IF NOT EXISTS "books_catalogversion" (
+    "id" integer NOT NULL PRIMARY KEY AUTOINCREMENT, 
+    "name" varchar(50) NOT NULL UNIQUE, 
+    "version" bigint unsigned NOT NULL CHECK ("version" >= 0)
+);
+
+INSERT INTO "books_catalogversion" ("name", "version") VALUES ("catalog", 0);
+INSERT INTO "books_catalogversion" ("name", "version") VALUES ("book_types", 0);
+
+CREATE TABLE IF NOT EXISTS "books_rental" (
+    "id" integer NOT NULL PRIMARY KEY AUTOINCREMENT, 
+    "days_rented" integer unsigned NOT NULL CHECK ("days_rented" >= 0), 
+    "rented_date" datetime NOT NULL, 
+    "due_date" datetime NOT NULL, 
+    "book_id" bigint NOT NULL REFERENCES "books_book" ("id") DEFERRABLE INITIALLY DEFERRED, 
+    "user_id" integer NULL REFERENCES "auth_user" ("id") DEFERRABLE INITIALLY DEFERRED
+);
+CREATE INDEX "rental_user_history" ON "books_rental" ("user_id", "rented_date");
+CREATE INDEX "rental_book_history" ON "books_rental" ("book_id", "rented_date");
+CREATE INDEX "rental_due_date" ON "books_rental" ("due_date");
+
+CREATE TABLE IF NOT EXISTS "books_rentalarchive" (
+    "id" integer NOT NULL PRIMARY KEY AUTOINCREMENT, 
+    "days_rented" integer unsigned NOT NULL CHECK ("days_rented" >= 0), 
+    "rented_date" datetime NOT NULL, 
+    "due_date" datetime NOT NULL, 
+    "archived_date" datetime NOT NULL, 
+    "book_id" bigint NOT NULL REFERENCES "books_book" ("id") DEFERRABLE INITIALLY DEFERRED, 
+    "user_id" integer NULL REFERENCES "auth_user" ("id") DEFERRABLE INITIALLY DEFERRED
+);
+CREATE INDEX "rentalarchive_user_history" ON "books_rentalarchive" ("user_id", "rented_date");
+CREATE INDEX "rentalarchive_book_history" ON "books_rentalarchive" ("book_id", "rented_date");
@@ -0,0 +1,30 @@
+import base64
+import json
+import re
+
+
+def encode_cursor(*values):
+    """Pack the sort key of the last row on a page into an opaque cursor."""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size=1):
+    """Unpack a cursor made by encode_cursor, raising ValueError if it is malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor.")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor.")
+    return values
+
+
+# Kept the same as books.models.fts_query in the Django site, which searches the same index
+def fts_query(text):
+    """Turn free text into an FTS5 query matching every word as a prefix."""
+    words = re.findall(r'\w+', text)
+    if not words:
+        return '""'
+    return ' '.join(f'"{word}"*' for word in words)
@@ -23,8 +23,8 @@ class TestHelper():
     def create_book(self, title='Test Title', author='Test Author', rental_due_date='', days_rented=0, renting_user_id=None, book_type_id=1):
         with self.app.app_context():
             db = get_db()
-            db.execute('INSERT INTO books_book (title, author, rental_due_date, days_rented, renting_user_id, book_type_id) VALUES (?,?,?,?,?,?)',
-                [title, author, rental_due_date, days_rented, renting_user_id, book_type_id])
+            db.execute('INSERT INTO books_book (title, author, rental_due_date, days_rented, renting_user_id, book_type_id, status) VALUES (?,?,?,?,?,?,?)',
+                [title, author, rental_due_date, days_rented, renting_user_id, book_type_id, 'available' if renting_user_id is None else 'rented'])
             db.commit()
     
     def create_user(self, username, password):
@@ -42,6 +42,10 @@ class TestHelper():
         base64_string = base64.b64encode(f"{self.username}:{self.password}".encode('utf-8')).decode('utf-8')
         return f"Basic {base64_string}"
 
+    def get_token_header(self, client):
+        rv = client.post('/api/v1/auth/token', headers={"Authorization": self.get_auth_header()})
+        return f"Bearer {rv.get_json()['token']}"
+
 
 @pytest.fixture
 def app():
@@ -49,7 +53,7 @@ def app():
     # create a temporary file to isolate the database for each test
     db_fd, db_path = tempfile.mkstemp()
     # create the app with common test config
-    app = create_app({"TESTING": True, "DATABASE": db_path})
+    app = create_app({"TESTING": True, "DATABASE": db_path, "SECRET_KEY": "test"})
 
     # create the database and load test data
     with app.app_context():
@@ -58,6 +62,7 @@ def app():
     yield app
 
     # close and remove the temporary database
+    app.extensions['db_pool'].close()
     os.close(db_fd)
     os.unlink(db_path)
 
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from argon2 import PasswordHasher
+
+from book_rental_store_api import auth
+from book_rental_store_api.aio import AsyncApp, _Instance
+
+
+async def asgi_get(application, path, headers=()):
+    """Send one GET through the ASGI application, returning (status, body)."""
+    messages = []
+    received = False
+
+    async def receive():
+        nonlocal received
+        if received:
+            await asyncio.sleep(3600)
+        received = True
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+        'root_path': '', 'headers': [(name.lower().encode(), value.encode()) for name, value in headers],
+        'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+    }
+    await application(scope, receive, send)
+    return messages[0]['status'], b''.join(m.get('body', b'') for m in messages[1:])
+
+
+@pytest.fixture
+def async_app(app):
+    application = AsyncApp(app)
+    yield application
+    application.executors.shutdown()
+
+
+def test_async_matches_sync(app, client, async_app, test_helper):
+    for i in range(100):
+        test_helper.create_book(title=f'Title {i}')
+    for path in ('/api/v1/resources/books', '/api/v1/resources/books?limit=10', '/api/v1/resources/books/7'):
+        status, body = asyncio.run(asgi_get(async_app, path))
+        assert status == 200
+        assert body == client.get(path).data
+
+
+def test_async_password_verified_on_hash_executor(app, async_app, test_helper, monkeypatch):
+    test_helper.create_user('test_user', 'test_password')
+    test_helper.create_book()
+    app.extensions['credential_cache'].maxsize = 0
+    threads = set()
+
+    class RecordingHasher(PasswordHasher):
+        def verify(self, hash, password):
+            threads.add(threading.current_thread().name)
+            return super().verify(hash, password)
+
+    monkeypatch.setattr(auth, 'password_hasher', RecordingHasher())
+    headers = [('Authorization', test_helper.get_auth_header())]
+
+    async def burst():
+        return await asyncio.gather(*[asgi_get(async_app, '/api/v1/resources/books/mybooks', headers)
+                                      for _ in range(8)])
+
+    assert [status for status, _ in asyncio.run(burst())] == [200] * 8
+    # Verified on the bounded hash executor, never on a request thread
+    assert threads and all(name.startswith('api-hash') for name in threads)
+
+    pool = app.extensions['db_pool'].stats()
+    assert pool['idle'] == pool['connections']
+
+
+def test_async_streamed_responses_release_connections(app, async_app, test_helper):
+    for i in range(300):
+        test_helper.create_book(title=f'Title {i}')
+
+    async def burst():
+        return await asyncio.gather(*[asgi_get(async_app, '/api/v1/resources/books') for _ in range(12)])
+
+    results = asyncio.run(burst())
+    assert all(status == 200 and body.count(b'"id"') == 300 for status, body in results)
+    pool = app.extensions['db_pool'].stats()
+    assert pool['idle'] == pool['connections']
+
+
+def test_async_body_stops_at_content_length():
+    closed = []
+
+    class Response(list):
+        def close(self):
+            closed.append(True)
+
+    def application(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', '5')])
+        return Response([b'abc', b'defgh', b'ijk'])
+
+    with ThreadPoolExecutor(1) as executor:
+        status, body = asyncio.run(asgi_get(lambda *args: _Instance(application, executor)(*args), '/'))
+    assert (status, body) == (200, b'abcde')
+    assert closed == [True]
+
+
+def test_async_lifespan(async_app):
+    messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+    sent = []
+
+    async def receive():
+        return next(messages)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    asyncio.run(async_app({'type': 'lifespan'}, receive, send))
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
@@ -1,3 +1,9 @@
+from argon2 import PasswordHasher
+
+from book_rental_store_api.auth import CredentialCache
+from book_rental_store_api.db import get_db
+
+
 def test_login_bad_username(client, test_helper):
     test_helper.username = "username"
     test_helper.password = "password"
@@ -14,3 +20,122 @@ def test_login_bad_password(client, test_helper):
                     headers={"Authorization": test_helper.get_auth_header()})
     assert rv.status_code == 401
     assert rv.get_json() == "Incorrect password."
+
+
+def test_login_cache_hit(app, client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    headers = {"Authorization": test_helper.get_auth_header()}
+
+    rv = client.get('/api/v1/resources/books/mybooks', headers=headers)
+    assert rv.status_code == 200
+    rv = client.get('/api/v1/resources/books/mybooks', headers=headers)
+    assert rv.status_code == 200
+
+    stats = app.extensions['credential_cache'].stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] == 1
+    assert stats['size'] == 1
+
+
+def test_login_cache_skips_failed_logins(app, client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    test_helper.password = "password"
+    headers = {"Authorization": test_helper.get_auth_header()}
+
+    for _ in range(2):
+        rv = client.get('/api/v1/resources/books/mybooks', headers=headers)
+        assert rv.status_code == 401
+
+    stats = app.extensions['credential_cache'].stats()
+    assert stats['hits'] == 0
+    assert stats['size'] == 0
+
+
+def test_login_cache_invalidated_on_password_change(app, client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    headers = {"Authorization": test_helper.get_auth_header()}
+
+    rv = client.get('/api/v1/resources/books/mybooks', headers=headers)
+    assert rv.status_code == 200
+
+    with app.app_context():
+        db = get_db()
+        db.execute('UPDATE auth_user SET password=? WHERE id=1',
+                   ["argon2" + PasswordHasher().hash('new_password')])
+        db.commit()
+
+    rv = client.get('/api/v1/resources/books/mybooks', headers=headers)
+    assert rv.status_code == 401
+    assert rv.get_json() == "Incorrect password."
+
+
+def test_credential_cache_bounded():
+    cache = CredentialCache(maxsize=2, ttl=300)
+    for i in range(3):
+        cache.set(cache.key(f'header {i}'), {'id': i})
+
+    assert cache.get(cache.key('header 0')) is None
+    assert cache.get(cache.key('header 2')) == {'id': 2}
+    assert cache.stats()['size'] == 2
+
+
+def test_credential_cache_expires():
+    cache = CredentialCache(maxsize=2, ttl=-1)
+    cache.set(cache.key('header'), {'id': 1})
+
+    assert cache.get(cache.key('header')) is None
+    assert cache.stats() == {'hits': 0, 'misses': 1, 'size': 0}
+
+
+def test_token_issue(client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    rv = client.post('/api/v1/auth/token',
+                     headers={"Authorization": test_helper.get_auth_header()})
+    assert rv.status_code == 201
+    res = rv.get_json()
+    assert res['token_type'] == 'Bearer'
+    assert res['expires_in'] == 900
+    assert res['token']
+
+
+def test_token_issue_bad_password(client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    test_helper.password = "password"
+    rv = client.post('/api/v1/auth/token',
+                     headers={"Authorization": test_helper.get_auth_header()})
+    assert rv.status_code == 401
+    assert rv.get_json() == "Incorrect password."
+
+
+def test_token_issue_no_credentials(client):
+    rv = client.post('/api/v1/auth/token')
+    assert rv.status_code == 401
+
+
+def test_token_login_skips_password_check(app, client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    headers = {"Authorization": test_helper.get_token_header(client)}
+    stats = app.extensions['credential_cache'].stats()
+
+    rv = client.get('/api/v1/resources/books/mybooks', headers=headers)
+    assert rv.status_code == 200
+    assert rv.get_json() == {'my_books': []}
+    assert app.extensions['credential_cache'].stats() == stats
+
+
+def test_token_login_invalid_token(client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    token = test_helper.get_token_header(client)
+    rv = client.get('/api/v1/resources/books/mybooks',
+                    headers={"Authorization": token[:-2] + "xx"})
+    assert rv.status_code == 401
+    assert rv.get_json() == "Invalid token."
+
+
+def test_token_login_expired_token(app, client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    headers = {"Authorization": test_helper.get_token_header(client)}
+    app.config['API_TOKEN_MAX_AGE'] = -1
+    rv = client.get('/api/v1/resources/books/mybooks', headers=headers)
+    assert rv.status_code == 401
+    assert rv.get_json() == "Token expired."
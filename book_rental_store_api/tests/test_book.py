@@ -1,4 +1,5 @@
 import datetime
+import threading
 
 def test_book_get_empty_table(client):
     rv = client.get('/api/v1/resources/books/1')
@@ -209,4 +210,35 @@ def test_book_put_no_body(client, test_helper):
                     headers={"Authorization": test_helper.get_auth_header()})
     assert rv.status_code == 400
     res = rv.get_json()
-    assert res == "Please provide days_to_rent in the request body."
\ No newline at end of file
+    assert res == "Please provide days_to_rent in the request body."
+
+def test_book_put_not_found(client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+
+    for data in [{'days_to_rent': 3}, {}]:
+        rv = client.put('/api/v1/resources/books/1', 
+                        headers={"Authorization": test_helper.get_auth_header()},
+                        data=data)
+        assert rv.status_code == 404
+        assert rv.get_json() == "No book found with id 1"
+
+
+def test_book_put_concurrent_renters(app, test_helper):
+    auth_headers = []
+    for i in range(8):
+        test_helper.create_user(f'test_user_{i}', 'test_password')
+        auth_headers.append({"Authorization": test_helper.get_auth_header()})
+    test_helper.create_book(book_type_id=3)
+    statuses = []
+
+    def rent(headers):
+        rv = app.test_client().put('/api/v1/resources/books/1', headers=headers, data={'days_to_rent': 3})
+        statuses.append(rv.status_code)
+
+    threads = [threading.Thread(target=rent, args=(headers,)) for headers in auth_headers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [201] + [403] * 7
@@ -1,5 +1,7 @@
 import datetime
 
+from book_rental_store_api.db import update_db
+
 
 def test_book_list_empty_table(client):
     rv = client.get('/api/v1/resources/books')
@@ -64,4 +66,169 @@ def test_book_list_title_and_author_filter(client, test_helper):
     assert 'books' in res
     assert len(res['books']) == 1
     assert res['books'][0].get('title') == 'TestTitle'
-    assert res['books'][0].get('author') == 'TestAuthor'
\ No newline at end of file
+    assert res['books'][0].get('author') == 'TestAuthor'
+
+def test_book_list_paginated(client, test_helper):
+    for i in range(5):
+        test_helper.create_book(title=f'Book {i}')
+    rv = client.get('/api/v1/resources/books?limit=2')
+    res = rv.get_json()
+    assert [book['title'] for book in res['books']] == ['Book 0', 'Book 1']
+    assert res['next'].startswith('/api/v1/resources/books?')
+
+    rv = client.get(res['next'])
+    res = rv.get_json()
+    assert [book['title'] for book in res['books']] == ['Book 2', 'Book 3']
+
+    rv = client.get(res['next'])
+    res = rv.get_json()
+    assert [book['title'] for book in res['books']] == ['Book 4']
+    assert res['next'] is None
+
+
+def test_book_list_paginated_with_filter(client, test_helper):
+    for i in range(4):
+        test_helper.create_book(author='TestAuthor' if i % 2 else 'Not returned', title=f'Book {i}')
+    rv = client.get('/api/v1/resources/books?author=TestAuthor&limit=1')
+    res = rv.get_json()
+    assert [book['title'] for book in res['books']] == ['Book 1']
+    assert 'author=TestAuthor' in res['next']
+
+    rv = client.get(res['next'])
+    res = rv.get_json()
+    assert [book['title'] for book in res['books']] == ['Book 3']
+    assert res['next'] is None
+
+
+def test_book_list_unpaginated_has_no_next(client, test_helper):
+    test_helper.create_book()
+    rv = client.get('/api/v1/resources/books')
+    assert 'next' not in rv.get_json()
+
+
+def test_book_list_bad_limit(client):
+    for limit in ['0', '1001', 'abc']:
+        rv = client.get(f'/api/v1/resources/books?limit={limit}')
+        assert rv.status_code == 400
+        assert rv.get_json() == "Please provide a limit between 1 and 1000"
+
+
+def test_book_list_bad_cursor(client):
+    for cursor in ['not-a-cursor', 'WyJ4Il0']:
+        rv = client.get(f'/api/v1/resources/books?after={cursor}')
+        assert rv.status_code == 400
+        assert rv.get_json() == "Invalid cursor."
+
+
+def test_book_list_search(client, test_helper):
+    test_helper.create_book(title='Harry Potter', author='J. K. Rowling')
+    test_helper.create_book(title='The Hobbit', author='J. R. R. Tolkien')
+    test_helper.create_book(title='Pottery Basics', author='Someone Else')
+    rv = client.get('/api/v1/resources/books?q=pot')
+    res = rv.get_json()
+    assert sorted(book['title'] for book in res['books']) == ['Harry Potter', 'Pottery Basics']
+
+    rv = client.get('/api/v1/resources/books?q=tolk')
+    res = rv.get_json()
+    assert [book['title'] for book in res['books']] == ['The Hobbit']
+
+
+def test_book_list_search_all_words(client, test_helper):
+    test_helper.create_book(title='Harry Potter', author='J. K. Rowling')
+    test_helper.create_book(title='Harry and the Hendersons', author='Someone Else')
+    rv = client.get('/api/v1/resources/books?q=harry%20rowl')
+    res = rv.get_json()
+    assert [book['title'] for book in res['books']] == ['Harry Potter']
+
+
+def test_book_list_search_ranked(client, test_helper):
+    test_helper.create_book(title='A long title that mentions dragons only once', author='Author')
+    test_helper.create_book(title='Dragons', author='Dragon Author')
+    rv = client.get('/api/v1/resources/books?q=dragon')
+    res = rv.get_json()
+    assert [book['title'] for book in res['books']][0] == 'Dragons'
+
+
+def test_book_list_search_tracks_updates(app, client, test_helper):
+    test_helper.create_book(title='Old Title')
+    with app.app_context():
+        update_db("UPDATE books_book SET title='New Title' WHERE id=1")
+    assert client.get('/api/v1/resources/books?q=old').get_json()['books'] == []
+    assert len(client.get('/api/v1/resources/books?q=new').get_json()['books']) == 1
+
+
+def test_book_list_search_no_words(client, test_helper):
+    test_helper.create_book()
+    rv = client.get('/api/v1/resources/books?q=%22%2A')
+    assert rv.status_code == 200
+    assert rv.get_json()['books'] == []
+
+
+def test_book_list_search_paginated(client, test_helper):
+    for i in range(3):
+        test_helper.create_book(title=f'Search Book {i}')
+    test_helper.create_book(title='Other')
+    rv = client.get('/api/v1/resources/books?q=search&limit=2')
+    res = rv.get_json()
+    titles = [book['title'] for book in res['books']]
+    assert len(titles) == 2
+
+    rv = client.get(res['next'])
+    res = rv.get_json()
+    titles += [book['title'] for book in res['books']]
+    assert sorted(titles) == ['Search Book 0', 'Search Book 1', 'Search Book 2']
+    assert res['next'] is None
+
+
+def test_book_list_stream_matches_jsonify(app, client, test_helper):
+    due_date = datetime.datetime.now() + datetime.timedelta(days=3)
+    for i in range(100):
+        test_helper.create_book(title=f'Book "{i}" é', rental_due_date=due_date if i % 3 else '',
+                                renting_user_id=1 if i % 3 else None, book_type_id=i % 3 + 1)
+
+    streamed = client.get('/api/v1/resources/books?author=Test%20Author')
+    assert 'Content-Length' not in streamed.headers
+    app.config['API_STREAM_RESPONSES'] = False
+    buffered = client.get('/api/v1/resources/books?author=Test%20Author')
+    assert 'Content-Length' in buffered.headers
+
+    assert streamed.data == buffered.data
+    assert streamed.mimetype == buffered.mimetype
+    assert len(streamed.get_json()['books']) == 100
+
+
+def test_book_list_stream_empty(app, client):
+    streamed = client.get('/api/v1/resources/books')
+    app.config['API_STREAM_RESPONSES'] = False
+    assert streamed.data == client.get('/api/v1/resources/books').data
+
+
+def test_book_list_stream_releases_connection(app, client, test_helper):
+    test_helper.create_book()
+    client.get('/api/v1/resources/books').close()
+    stats = app.extensions['db_pool'].stats()
+    assert stats['idle'] == stats['connections']
+
+
+def test_book_list_status_filter(client, test_helper):
+    due_date = datetime.datetime.now() + datetime.timedelta(days=3)
+    past_due_date = datetime.datetime.now() + datetime.timedelta(days=-3)
+    test_helper.create_book(title='Rented', rental_due_date=due_date, renting_user_id=1)
+    test_helper.create_book(title='Past due', rental_due_date=past_due_date, renting_user_id=1)
+    test_helper.create_book(title='Never rented')
+
+    rv = client.get('/api/v1/resources/books?status=available')
+    res = rv.get_json()
+    assert [book['title'] for book in res['books']] == ['Past due', 'Never rented']
+    assert all(book['status'] == 'Available' for book in res['books'])
+
+    rv = client.get('/api/v1/resources/books?status=rented')
+    res = rv.get_json()
+    assert [book['title'] for book in res['books']] == ['Rented']
+    assert res['books'][0]['status'] == 'Rented'
+
+
+def test_book_list_bad_status_filter(client):
+    rv = client.get('/api/v1/resources/books?status=lost')
+    assert rv.status_code == 400
+    assert rv.get_json() == "Please provide a status of available or rented"
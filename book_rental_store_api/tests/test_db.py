@@ -0,0 +1,248 @@
+import logging
+import threading
+
+import pytest
+
+from book_rental_store_api import create_app, db
+from book_rental_store_api.db import (ConnectionPool, PoolTimeout, WriteTimeout, catalog_version, get_db, param_shape,
+                                      query_db, slow_query_logger, update_db)
+
+
+def test_get_db_reuses_connection_within_context(app):
+    with app.app_context():
+        assert get_db() is get_db()
+
+
+def test_get_db_returns_connection_to_pool(app):
+    with app.app_context():
+        first = get_db()
+    with app.app_context():
+        assert get_db() is first
+
+    stats = app.extensions['db_pool'].stats()
+    assert stats['connections'] == 1
+    assert stats['idle'] == 1
+
+
+def test_released_connection_is_rolled_back(app, test_helper):
+    test_helper.create_book()
+    with app.app_context():
+        get_db().execute("DELETE FROM books_book")
+    with app.app_context():
+        assert len(query_db("SELECT * FROM books_book")) == 1
+
+
+def test_pool_connection_row_factory(app):
+    with app.app_context():
+        rows = query_db("SELECT 1 AS one")
+        assert rows[0]['one'] == 1
+        assert dict(rows[0]) == {'one': 1}
+
+
+def test_pool_bounded(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.sqlite3'), size=2, timeout=0.01)
+    first = pool.acquire()
+    second = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+
+    pool.release(first)
+    assert pool.acquire() is first
+
+    stats = pool.stats()
+    assert stats['connections'] == 2
+    assert stats['acquisitions'] == 3
+    assert stats['waits'] == 0
+    assert stats['timeouts'] == 1
+    pool.release(first)
+    pool.release(second)
+    pool.close()
+
+
+def test_pool_waits_for_release(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.sqlite3'), size=1, timeout=5)
+    conn = pool.acquire()
+    threading.Timer(0.05, pool.release, [conn]).start()
+
+    assert pool.acquire() is conn
+    stats = pool.stats()
+    assert stats['waits'] == 1
+    assert stats['wait_seconds_max'] >= 0.04
+    pool.release(conn)
+    pool.close()
+
+
+def test_param_shape():
+    assert param_shape(()) == '()'
+    assert param_shape(('title', 3, 4, 5, None)) == '(str, int x3, NoneType)'
+    assert param_shape({'user': 1}) == '{user: int}'
+
+
+def test_slow_queries_logged_with_plan(app, test_helper, caplog, monkeypatch):
+    test_helper.create_book()
+    app.extensions['db_pool'].slow_query_log.threshold = 0
+    explained = []
+    original = db.format_plan
+
+    def format_plan(rows):
+        explained.append(rows)
+        return original(rows)
+
+    monkeypatch.setattr(db, 'format_plan', format_plan)
+    with app.app_context(), caplog.at_level(logging.WARNING, logger=slow_query_logger.name):
+        for i in range(3):
+            query_db('SELECT * FROM books_book WHERE id = ?', (1,))
+        update_db('UPDATE books_book SET title = ? WHERE id = ?', ('Other', 1))
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert len(messages) == 4
+    assert 'SELECT * FROM books_book WHERE id = ?' in messages[0]
+    assert 'params: (int)' in messages[0]
+    assert 'SEARCH books_book USING INTEGER PRIMARY KEY' in messages[0]
+    assert 'params: (str, int)' in messages[3]
+    assert 'Other' not in messages[3]
+    # Each distinct statement is explained once
+    assert len(explained) == 2
+
+
+def test_fast_queries_not_logged(app, test_helper, caplog):
+    test_helper.create_book()
+    with app.app_context(), caplog.at_level(logging.WARNING, logger=slow_query_logger.name):
+        query_db('SELECT * FROM books_book')
+    assert not caplog.records
+
+
+def test_slow_query_log_file(app, tmp_path):
+    path = tmp_path / 'slow_queries.log'
+    slow_app = create_app({"TESTING": True, "DATABASE": app.config['DATABASE'], "SECRET_KEY": "test",
+                           "DATABASE_SLOW_QUERY_SECONDS": 0, "DATABASE_SLOW_QUERY_LOG": str(path)})
+    handlers = list(slow_query_logger.handlers)
+    try:
+        with slow_app.app_context():
+            query_db('SELECT count(*) FROM books_book')
+        assert 'SELECT count(*) FROM books_book' in path.read_text()
+    finally:
+        for handler in handlers:
+            slow_query_logger.removeHandler(handler)
+            handler.close()
+        slow_app.extensions['db_pool'].close()
+
+
+@pytest.fixture
+def queued_app(app):
+    queued_app = create_app({"TESTING": True, "DATABASE": app.config['DATABASE'], "SECRET_KEY": "test",
+                             "DATABASE_WRITE_QUEUE": True, "DATABASE_WRITE_TIMEOUT": 5})
+    yield queued_app
+    queued_app.extensions['db_writer'].close()
+    queued_app.extensions['db_pool'].close()
+
+
+def block_writer(writer):
+    """Hold the writer thread in a write until the returned event is set."""
+    started, release = threading.Event(), threading.Event()
+    writer.submit(lambda conn: started.set() or release.wait(5))
+    assert started.wait(5)
+    return release
+
+
+def set_title(conn, book_id, title):
+    return conn.execute("UPDATE books_book SET title = ? WHERE id = ?", (title, book_id)).rowcount
+
+
+def test_write_queue_group_commits(queued_app, test_helper):
+    for i in range(5):
+        test_helper.create_book()
+    writer = queued_app.extensions['db_writer']
+    with queued_app.app_context():
+        version = catalog_version()
+
+    release = block_writer(writer)
+    pending = [writer.submit(set_title, book_id, f'Title {book_id}') for book_id in range(1, 6)]
+    release.set()
+    assert [future.result(5) for future in pending] == [1] * 5
+
+    assert writer.stats() == {'writes': 6, 'batches': 2, 'queued': 0}
+    with queued_app.app_context():
+        assert [row['title'] for row in query_db("SELECT title FROM books_book")] == [f'Title {i}' for i in range(1, 6)]
+        assert catalog_version() == version + 1
+
+
+def test_write_queue_failed_write_undone_alone(queued_app, test_helper):
+    test_helper.create_book()
+    writer = queued_app.extensions['db_writer']
+
+    def fail(conn):
+        set_title(conn, 1, 'Failed')
+        raise ValueError('failed')
+
+    release = block_writer(writer)
+    failed = writer.submit(fail)
+    kept = writer.submit(set_title, 1, 'Kept')
+    release.set()
+    with pytest.raises(ValueError):
+        failed.result(5)
+    assert kept.result(5) == 1
+    with queued_app.app_context():
+        assert query_db("SELECT title FROM books_book")[0]['title'] == 'Kept'
+
+
+def test_write_queue_failed_writes_keep_catalog_version(queued_app, test_helper):
+    test_helper.create_book()
+    test_helper.create_book()
+    writer = queued_app.extensions['db_writer']
+    with queued_app.app_context():
+        version = catalog_version()
+
+    def fail(conn, book_id):
+        set_title(conn, book_id, 'Failed')
+        raise ValueError('failed')
+
+    release = block_writer(writer)
+    pending = [writer.submit(fail, book_id) for book_id in (1, 2)]
+    release.set()
+    for future in pending:
+        with pytest.raises(ValueError):
+            future.result(5)
+    assert writer.stats()['batches'] == 2
+    with queued_app.app_context():
+        assert catalog_version() == version
+
+
+def test_write_queue_timeout(queued_app, test_helper):
+    test_helper.create_book()
+    writer = queued_app.extensions['db_writer']
+    release = block_writer(writer)
+    with pytest.raises(WriteTimeout):
+        writer.run(set_title, 1, 'Late', timeout=0.05)
+    release.set()
+    assert writer.run(set_title, 1, 'On time', timeout=5) == 1
+    with queued_app.app_context():
+        assert query_db("SELECT title FROM books_book")[0]['title'] == 'On time'
+
+    queued_app.config['DATABASE_WRITE_TIMEOUT'] = 0.05
+    test_helper.create_user('test_user', 'test_password')
+    release = block_writer(writer)
+    rv = queued_app.test_client().put('/api/v1/resources/books/1', data={'days_to_rent': 3},
+                                      headers={"Authorization": test_helper.get_auth_header()})
+    release.set()
+    assert rv.status_code == 503
+    assert rv.get_json() == "The database is busy, please try again."
+
+
+def test_write_queue_rentals(queued_app, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    for i in range(3):
+        test_helper.create_book()
+    client = queued_app.test_client()
+    headers = {"Authorization": test_helper.get_auth_header()}
+
+    assert client.put('/api/v1/resources/books/1', data={'days_to_rent': 3}, headers=headers).status_code == 201
+    assert client.put('/api/v1/resources/books/1', data={'days_to_rent': 3}, headers=headers).status_code == 403
+    rv = client.post('/api/v1/resources/books/rentals', headers=headers,
+                     json=[{'book_id': 2, 'days_to_rent': 3}, {'book_id': 1, 'days_to_rent': 3}])
+    assert rv.status_code == 403
+    rv = client.post('/api/v1/resources/books/rentals', headers=headers,
+                     json=[{'book_id': 2, 'days_to_rent': 3}, {'book_id': 3, 'days_to_rent': 3}])
+    assert rv.status_code == 201
+    with queued_app.app_context():
+        assert [row['book_id'] for row in query_db("SELECT book_id FROM books_rental ORDER BY id")] == [1, 2, 3]
@@ -0,0 +1,77 @@
+import datetime
+
+from book_rental_store_api.db import get_db
+
+
+def test_book_list_etag_not_modified(client, test_helper):
+    test_helper.create_book()
+    rv = client.get('/api/v1/resources/books')
+    assert rv.status_code == 200
+    assert rv.headers['ETag'].startswith('W/')
+    assert 'Authorization' in rv.headers['Vary']
+
+    rv = client.get('/api/v1/resources/books', headers={'If-None-Match': rv.headers['ETag']})
+    assert rv.status_code == 304
+    assert rv.data == b''
+
+
+def test_book_list_etag_skips_books_table(app, client, test_helper):
+    test_helper.create_book()
+    etag = client.get('/api/v1/resources/books').headers['ETag']
+
+    statements = []
+    with app.app_context():
+        get_db().set_trace_callback(statements.append)
+    rv = client.get('/api/v1/resources/books', headers={'If-None-Match': etag})
+    with app.app_context():
+        get_db().set_trace_callback(None)
+
+    assert rv.status_code == 304
+    assert statements
+    assert not [statement for statement in statements if 'books_book ' in statement]
+
+
+def test_book_list_etag_varies_by_query(client, test_helper):
+    test_helper.create_book()
+    etag = client.get('/api/v1/resources/books').headers['ETag']
+    rv = client.get('/api/v1/resources/books?title=Test%20Title', headers={'If-None-Match': etag})
+    assert rv.status_code == 200
+
+
+def test_book_etag_changes_after_rental(client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    test_helper.create_book(book_type_id=3)
+    etag = client.get('/api/v1/resources/books/1').headers['ETag']
+
+    rv = client.put('/api/v1/resources/books/1',
+                    headers={"Authorization": test_helper.get_auth_header()},
+                    data={'days_to_rent': 3})
+    assert rv.status_code == 201
+
+    rv = client.get('/api/v1/resources/books/1', headers={'If-None-Match': etag})
+    assert rv.status_code == 200
+    assert rv.get_json()['status'] == 'Rented'
+    assert rv.headers['ETag'] != etag
+
+
+def test_book_etag_per_user(client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    due_date = datetime.datetime.now() + datetime.timedelta(days=3)
+    test_helper.create_book(rental_due_date=due_date, days_rented=3, renting_user_id=1)
+    anonymous = client.get('/api/v1/resources/books/1')
+    assert 'due_date' not in anonymous.get_json()
+
+    rv = client.get('/api/v1/resources/books/1',
+                    headers={"Authorization": test_helper.get_auth_header(),
+                             'If-None-Match': anonymous.headers['ETag']})
+    assert rv.status_code == 200
+    assert 'due_date' in rv.get_json()
+    assert 'total_rental_charge' in rv.get_json()
+
+
+def test_my_books_etag_not_modified(client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    headers = {"Authorization": test_helper.get_auth_header()}
+    etag = client.get('/api/v1/resources/books/mybooks', headers=headers).headers['ETag']
+    rv = client.get('/api/v1/resources/books/mybooks', headers={**headers, 'If-None-Match': etag})
+    assert rv.status_code == 304
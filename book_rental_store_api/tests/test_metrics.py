@@ -0,0 +1,89 @@
+import re
+import tracemalloc
+
+import pytest
+
+from book_rental_store_api import create_app
+from book_rental_store_api.metrics import Histogram
+
+
+def parse_metrics(text):
+    samples = {}
+    for line in text.splitlines():
+        if not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_histogram_buckets():
+    histogram = Histogram(buckets=(0.001, 0.01))
+    for seconds in (0.0005, 0.001, 0.005, 0.5):
+        histogram.observe(seconds)
+    counts, total = histogram.snapshot()
+    assert counts == [2, 1, 1]
+    assert total == pytest.approx(0.5065)
+
+
+def test_histogram_observe_does_not_allocate():
+    histogram = Histogram()
+    histogram.observe(0.002)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        for i in range(10000):
+            histogram.observe(0.002)
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    grown = sum(stat.size_diff for stat in after.compare_to(before, 'filename')
+                if stat.traceback[0].filename.endswith('metrics.py'))
+    assert grown < 1024
+
+
+def test_metrics_report_phases(client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    for i in range(5):
+        test_helper.create_book(title=f'Title {i}')
+    headers = {"Authorization": test_helper.get_auth_header()}
+    client.get('/api/v1/resources/books', headers=headers)
+    client.get('/api/v1/resources/books?limit=2', headers=headers)
+    client.get('/api/v1/resources/books/mybooks', headers=headers)
+
+    rv = client.get('/metrics')
+    assert rv.status_code == 200
+    assert rv.mimetype == 'text/plain'
+    samples = parse_metrics(rv.get_data(as_text=True))
+
+    assert samples['api_phase_seconds_count{phase="auth"}'] == 3
+    assert samples['api_phase_seconds_count{phase="format"}'] == 3
+    assert samples['api_phase_seconds_count{phase="db"}'] >= 6
+    assert samples['api_phase_seconds_count{phase="encode"}'] >= 3
+    for phase in ('auth', 'db', 'format', 'encode'):
+        assert samples[f'api_phase_seconds_sum{{phase="{phase}"}}'] > 0
+        assert samples[f'api_phase_seconds_bucket{{phase="{phase}",le="+Inf"}}'] == \
+            samples[f'api_phase_seconds_count{{phase="{phase}"}}']
+    assert samples['api_request_seconds_count{endpoint="books.index"}'] == 2
+    assert samples['api_request_seconds_count{endpoint="books.my_books"}'] == 1
+    assert samples['api_credential_cache_hits_total'] == 2
+    assert samples['api_credential_cache_misses_total'] == 1
+    assert samples['api_db_pool_connections'] == 1
+
+
+def test_metrics_buckets_cumulative(client, test_helper):
+    test_helper.create_book()
+    client.get('/api/v1/resources/books/1')
+    text = client.get('/metrics').get_data(as_text=True)
+    buckets = [float(value) for value in re.findall(r'^api_phase_seconds_bucket\{phase="db",le="[^"]+"\} (\S+)$',
+                                                     text, re.M)]
+    assert len(buckets) == 17
+    assert buckets == sorted(buckets)
+
+
+def test_metrics_disabled(app):
+    app = create_app({"TESTING": True, "DATABASE": app.config['DATABASE'], "SECRET_KEY": "test",
+                      "API_METRICS": False})
+    assert 'metrics' not in app.extensions
+    assert app.test_client().get('/metrics').status_code == 404
+    assert app.test_client().get('/api/v1/resources/books').status_code == 200
+    app.extensions['db_pool'].close()
@@ -90,4 +90,22 @@ def test_my_books_title_and_author_filter(client, test_helper):
     assert 'my_books' in res
     assert len(res['my_books']) == 1
     assert res['my_books'][0].get('title') == 'TestTitle'
-    assert res['my_books'][0].get('author') == 'TestAuthor'
\ No newline at end of file
+    assert res['my_books'][0].get('author') == 'TestAuthor'
+
+def test_my_books_paginated(client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+
+    due_date = datetime.datetime.now() + datetime.timedelta(days=3)
+    for i in range(3):
+        test_helper.create_book(title=f'Book {i}', renting_user_id=1, rental_due_date=due_date)
+    test_helper.create_book(title='Not mine', renting_user_id=2, rental_due_date=due_date)
+    headers = {"Authorization": test_helper.get_auth_header()}
+
+    rv = client.get('/api/v1/resources/books/mybooks?limit=2', headers=headers)
+    res = rv.get_json()
+    assert [book['title'] for book in res['my_books']] == ['Book 0', 'Book 1']
+
+    rv = client.get(res['next'], headers=headers)
+    res = rv.get_json()
+    assert [book['title'] for book in res['my_books']] == ['Book 2']
+    assert res['next'] is None
@@ -0,0 +1,53 @@
+from book_rental_store_api.books import BASE_QUERY, SEARCH_QUERY
+from book_rental_store_api.db import get_db
+from book_rental_store_api.pricing import BUMP_BOOK_TYPES_VERSION, get_book_types
+
+
+def test_catalog_queries_only_read_books():
+    assert 'books_booktype' not in BASE_QUERY
+    assert 'books_booktype' not in SEARCH_QUERY
+
+
+def test_book_types_loaded_once(app):
+    with app.test_request_context():
+        book_types = get_book_types()
+        assert book_types[3]['book_type'] == 'Fiction'
+        assert book_types[3]['rental_rate'] == 3.00
+    cache = app.extensions['book_types']
+    with app.test_request_context():
+        assert get_book_types() is book_types
+    assert cache.version == 0
+
+
+def test_book_types_reloaded_when_stamp_moves(app, client, test_helper):
+    test_helper.create_book(book_type_id=3)
+    rv = client.get('/api/v1/resources/books/1')
+    assert rv.get_json()['regular_rental_charge'] == 3.00
+
+    # Edited without bumping the stamp: the cached price is still served
+    with app.app_context():
+        db = get_db()
+        db.execute("UPDATE books_booktype SET rental_rate = 4.5 WHERE id = 3")
+        db.commit()
+    rv = client.get('/api/v1/resources/books/1')
+    assert rv.get_json()['regular_rental_charge'] == 3.00
+
+    with app.app_context():
+        db = get_db()
+        db.execute(BUMP_BOOK_TYPES_VERSION)
+        db.commit()
+    rv = client.get('/api/v1/resources/books/1')
+    assert rv.get_json()['regular_rental_charge'] == 4.50
+
+
+def test_unknown_book_type_forces_reload(app, client, test_helper):
+    client.get('/api/v1/resources/books')
+    with app.app_context():
+        db = get_db()
+        db.execute('INSERT INTO books_booktype (id, book_type, rental_rate, min_days, min_days_rate) '
+                   'VALUES (4, "Comic", 2.00, 0, 0)')
+        db.commit()
+    test_helper.create_book(book_type_id=4)
+
+    rv = client.get('/api/v1/resources/books/1')
+    assert rv.get_json()['type'] == 'Comic'
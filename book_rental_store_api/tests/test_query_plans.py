@@ -0,0 +1,82 @@
+import re
+import sqlite3
+
+import pytest
+
+from book_rental_store_api.db import get_db
+from book_rental_store_api.util import encode_cursor
+
+
+def record_statements(app):
+    """Collect every statement the app runs, with its parameters inlined."""
+    statements = []
+    with app.app_context():
+        # Requests made one after another reuse this pooled connection
+        get_db().set_trace_callback(statements.append)
+    return statements
+
+
+def full_scans(database, statements):
+    """(statement, plan line) for filtered statements that read a whole table or index."""
+    scans = []
+    with sqlite3.connect(database) as db:
+        for statement in dict.fromkeys(statements):
+            # An unfiltered read, like the whole catalog or the book types, has nothing to search on
+            if not re.match(r'\s*(SELECT|UPDATE|DELETE)\b.*\bWHERE\b', statement, re.S | re.I):
+                continue
+            for row in db.execute("EXPLAIN QUERY PLAN " + statement):
+                if row[3].startswith('SCAN') and 'VIRTUAL TABLE' not in row[3]:
+                    scans.append((' '.join(statement.split()), row[3]))
+    return scans
+
+
+@pytest.fixture
+def catalog(app, test_helper):
+    """A catalog shaped like a real one, mostly available, with planner statistics."""
+    test_helper.create_user('test_user', 'test_password')
+    for i in range(200):
+        rented = i % 20 == 0
+        test_helper.create_book(title=f'Title {i}', author=f'Author {i % 40}',
+                                rental_due_date='2099-01-01 00:00:00' if rented else '',
+                                renting_user_id=1 if rented else None, days_rented=3 if rented else 0)
+    with sqlite3.connect(app.config['DATABASE']) as db:
+        db.execute("ANALYZE")
+    return {"Authorization": test_helper.get_auth_header()}
+
+
+# The unfiltered catalog and status=available, most of it, are read in id order with a scan
+
+
+@pytest.mark.parametrize('path', [
+    '/api/v1/resources/books?title=title%203',
+    '/api/v1/resources/books?author=AUTHOR%201&limit=2',
+    '/api/v1/resources/books?title=Title%203&author=Author%203',
+    '/api/v1/resources/books?status=rented',
+    '/api/v1/resources/books?status=rented&limit=5',
+    '/api/v1/resources/books?q=title&limit=5',
+    f'/api/v1/resources/books?limit=5&after={encode_cursor(10)}',
+    '/api/v1/resources/books/mybooks',
+    '/api/v1/resources/books/mybooks?title=title%2020&limit=5',
+    '/api/v1/resources/books/7',
+    '/api/v1/resources/books/20',
+])
+def test_reads_use_indexes(app, client, catalog, path):
+    statements = record_statements(app)
+    assert client.get(path, headers=catalog).status_code == 200
+    assert statements
+    assert full_scans(app.config['DATABASE'], statements) == []
+
+
+def test_rentals_use_indexes(app, client, catalog):
+    statements = record_statements(app)
+    assert client.put('/api/v1/resources/books/5', data={'days_to_rent': 3}, headers=catalog).status_code == 201
+    assert client.put('/api/v1/resources/books/5', data={'days_to_rent': 3}, headers=catalog).status_code == 403
+    rv = client.post('/api/v1/resources/books/rentals', json=[{'book_id': 6, 'days_to_rent': 3}], headers=catalog)
+    assert rv.status_code == 201
+    assert any(statement.startswith('UPDATE books_book') for statement in statements)
+    assert full_scans(app.config['DATABASE'], statements) == []
+
+
+def test_title_and_author_filters_ignore_case(client, catalog):
+    rv = client.get('/api/v1/resources/books?title=TITLE%203&author=author%203', headers=catalog)
+    assert [book['title'] for book in rv.get_json()['books']] == ['Title 3']
@@ -0,0 +1,203 @@
+import datetime
+
+from book_rental_store_api.db import catalog_version, get_db, query_db
+from book_rental_store_api.rentals import archive_rentals, sweep_rentals
+
+
+def rent(client, test_helper, rentals):
+    return client.post('/api/v1/resources/books/rentals',
+                       headers={"Authorization": test_helper.get_auth_header()},
+                       json={'rentals': rentals})
+
+
+def test_rentals_not_logged_in(client):
+    rv = client.post('/api/v1/resources/books/rentals', json={'rentals': []})
+    assert rv.status_code == 401
+    assert rv.get_json() == "Unauthorized"
+
+
+def test_rentals_rent_several_books(app, client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    test_helper.create_book(title='Regular', book_type_id=1)
+    test_helper.create_book(title='Fiction', book_type_id=3)
+    with app.app_context():
+        version = catalog_version()
+
+    rv = rent(client, test_helper, [{'book_id': 2, 'days_to_rent': 3},
+                                    {'book_id': 1, 'days_to_rent': 5}])
+    assert rv.status_code == 201
+    res = rv.get_json()
+    assert [book['title'] for book in res['books']] == ['Fiction', 'Regular']
+    assert all(book['status'] == 'Rented' for book in res['books'])
+    assert res['books'][0]['total_rental_charge'] == 9.00
+    assert res['books'][1]['total_rental_charge'] == 6.50
+    assert res['total_rental_charge'] == 15.50
+    due_date = datetime.datetime.now() + datetime.timedelta(days=3)
+    assert res['books'][0]['due_date'] == str(due_date)[:16]
+    with app.app_context():
+        assert catalog_version() == version + 1
+
+    rv = client.get('/api/v1/resources/books/mybooks',
+                    headers={"Authorization": test_helper.get_auth_header()})
+    assert len(rv.get_json()['my_books']) == 2
+
+
+def test_rentals_accepts_bare_list(client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    test_helper.create_book()
+    rv = client.post('/api/v1/resources/books/rentals',
+                     headers={"Authorization": test_helper.get_auth_header()},
+                     json=[{'book_id': 1, 'days_to_rent': 3}])
+    assert rv.status_code == 201
+
+
+def test_rentals_all_or_nothing(client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    due_date = datetime.datetime.now() + datetime.timedelta(days=3)
+    test_helper.create_book()
+    test_helper.create_book(rental_due_date=due_date, renting_user_id=2)
+
+    rv = rent(client, test_helper, [{'book_id': 1, 'days_to_rent': 3},
+                                    {'book_id': 2, 'days_to_rent': 3}])
+    assert rv.status_code == 403
+    assert rv.get_json() == "Sorry, these books are not available right now: 2"
+
+    rv = client.get('/api/v1/resources/books/1')
+    assert rv.get_json()['status'] == 'Available'
+
+
+def test_rentals_missing_book(client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    test_helper.create_book()
+    rv = rent(client, test_helper, [{'book_id': 1, 'days_to_rent': 3},
+                                    {'book_id': 5, 'days_to_rent': 3}])
+    assert rv.status_code == 404
+    assert rv.get_json() == "No book found with id 5"
+
+    rv = client.get('/api/v1/resources/books/1')
+    assert rv.get_json()['status'] == 'Available'
+
+
+def test_rentals_bad_input(client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    test_helper.create_book()
+    cases = [
+        ([], "Please provide a list of between 1 and 100 rentals."),
+        ({'book_id': 1}, "Please provide a list of between 1 and 100 rentals."),
+        ([{'days_to_rent': 3}], "Please provide a book_id and days_to_rent for each rental."),
+        ([{'book_id': 1, 'days_to_rent': 30}], "Please provide a days_to_rent between 1 and 30 days"),
+        ([{'book_id': 1}], "Please provide a days_to_rent between 1 and 30 days"),
+        ([{'book_id': 1, 'days_to_rent': True}], "Please provide a days_to_rent between 1 and 30 days"),
+        ([{'book_id': 1, 'days_to_rent': 3.7}], "Please provide a days_to_rent between 1 and 30 days"),
+        ([{'book_id': 1, 'days_to_rent': '3'}], "Please provide a days_to_rent between 1 and 30 days"),
+        ([{'book_id': 1, 'days_to_rent': 3}, {'book_id': 1, 'days_to_rent': 4}],
+         "Book 1 is listed more than once."),
+    ]
+    for rentals, message in cases:
+        rv = rent(client, test_helper, rentals)
+        assert rv.status_code == 400
+        assert rv.get_json() == message
+
+
+def rental_history(app, table='books_rental'):
+    with app.app_context():
+        return [tuple(row) for row in query_db(f'SELECT book_id, user_id, days_rented FROM {table} ORDER BY id')]
+
+
+def test_rentals_recorded(app, client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    test_helper.create_book()
+    test_helper.create_book()
+    test_helper.create_book()
+    rv = rent(client, test_helper, [{'book_id': 2, 'days_to_rent': 3},
+                                    {'book_id': 1, 'days_to_rent': 5}])
+    assert rv.status_code == 201
+    rv = client.put('/api/v1/resources/books/3', headers={"Authorization": test_helper.get_auth_header()},
+                    data={'days_to_rent': 4})
+    assert rv.status_code == 201
+
+    assert rental_history(app) == [(2, 1, 3), (1, 1, 5), (3, 1, 4)]
+
+
+def test_failed_rentals_not_recorded(app, client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    due_date = datetime.datetime.now() + datetime.timedelta(days=3)
+    test_helper.create_book()
+    test_helper.create_book(rental_due_date=due_date, renting_user_id=2)
+
+    rv = rent(client, test_helper, [{'book_id': 1, 'days_to_rent': 3},
+                                    {'book_id': 2, 'days_to_rent': 3}])
+    assert rv.status_code == 403
+    rv = client.put('/api/v1/resources/books/2', headers={"Authorization": test_helper.get_auth_header()},
+                    data={'days_to_rent': 3})
+    assert rv.status_code == 403
+
+    assert rental_history(app) == []
+
+
+def test_archive_rentals(app, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    test_helper.create_book()
+    now = datetime.datetime.now()
+    with app.app_context():
+        db = get_db()
+        db.executemany('INSERT INTO books_rental (book_id, user_id, days_rented, rented_date, due_date) '
+                       'VALUES (1, 1, ?, ?, ?)',
+                       [(days, now - datetime.timedelta(days=days + 10), now + datetime.timedelta(days=offset))
+                        for days, offset in ((1, -9), (2, -8), (3, -1), (4, 2))])
+        db.commit()
+        version = catalog_version()
+
+        assert archive_rentals(now - datetime.timedelta(days=5), batch_size=1) == 2
+        assert catalog_version() == version
+
+    assert rental_history(app) == [(1, 1, 3), (1, 1, 4)]
+    assert rental_history(app, 'books_rentalarchive') == [(1, 1, 1), (1, 1, 2)]
+
+    result = app.test_cli_runner().invoke(args=['archive-rentals'])
+    assert result.exit_code == 0, result.output
+    assert 'Archived 1 rentals' in result.output
+    assert rental_history(app) == [(1, 1, 4)]
+
+
+def book_statuses(app):
+    with app.app_context():
+        return [row['status'] for row in query_db("SELECT status FROM books_book ORDER BY id")]
+
+
+def test_rent_marks_book_rented(app, client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    for i in range(3):
+        test_helper.create_book()
+    client.put('/api/v1/resources/books/1', headers={"Authorization": test_helper.get_auth_header()},
+               data={'days_to_rent': 3})
+    rent(client, test_helper, [{'book_id': 2, 'days_to_rent': 3}])
+    assert book_statuses(app) == ['rented', 'rented', 'available']
+
+
+def test_sweep_rentals(app, client, test_helper):
+    test_helper.create_user('test_user', 'test_password')
+    now = datetime.datetime.now()
+    for days in (-3, -2, -1, 3):
+        test_helper.create_book(title=f'Due in {days}', rental_due_date=now + datetime.timedelta(days=days),
+                                renting_user_id=1, days_rented=3)
+    available = ['Due in -3', 'Due in -2', 'Due in -1']
+
+    # Expired rentals are available before they are swept
+    rv = client.get('/api/v1/resources/books?status=available')
+    assert [book['title'] for book in rv.get_json()['books']] == available
+    assert book_statuses(app) == ['rented'] * 4
+
+    with app.app_context():
+        version = catalog_version()
+        assert sweep_rentals(str(now), batch_size=2) == 3
+        assert catalog_version() == version
+    assert book_statuses(app) == ['available', 'available', 'available', 'rented']
+    rv = client.get('/api/v1/resources/books?status=available')
+    assert [book['title'] for book in rv.get_json()['books']] == available
+    rv = client.get('/api/v1/resources/books?status=rented')
+    assert [book['title'] for book in rv.get_json()['books']] == ['Due in 3']
+
+    result = app.test_cli_runner().invoke(args=['sweep-rentals'])
+    assert result.exit_code == 0, result.output
+    assert 'Marked 0 expired rentals available' in result.output